@@ -16,7 +16,9 @@ class User(Base):
     password: Mapped[str] = mapped_column(String(255), nullable=False)
     email: Mapped[str] = mapped_column(String(255), nullable=False)
     user_info_id: Mapped[ulid.ULID] = mapped_column(ULID(), ForeignKey('user_infos.user_info_id'), nullable=False, unique=True)
-    selected_theme_id: Mapped[ulid.ULID] = mapped_column(ULID(), ForeignKey('themes.theme_id', ondelete='RESTRICT'), nullable=True)
+    # themes.owner_id와 서로 참조한다, 이름을 붙여 ALTER로 따로 만들고 지워야 PostgreSQL에서 drop_all이 순서를 정할 수 있다
+    selected_theme_id: Mapped[ulid.ULID] = mapped_column(ULID(), ForeignKey('themes.theme_id', ondelete='RESTRICT', use_alter=True,
+                                                                            name='fk_users_selected_theme_id'), nullable=True)
 
     user_info = relationship('UserInfo', uselist=False, back_populates='user')
     refresh_tokens = relationship('RefreshToken', back_populates='owner', cascade='all, delete-orphan')
@@ -38,7 +40,7 @@ class UserInfo(Base):
     role: Mapped[int] = mapped_column(Integer, nullable=False)
     clazz: Mapped[int] = mapped_column(SmallInteger, nullable=True)
     number: Mapped[int] = mapped_column(SmallInteger, nullable=True)
-    generation: Mapped[int] = mapped_column(SmallInteger, nullable=True)
+    generation: Mapped[int] = mapped_column(SmallInteger, nullable=True, index=True)
     credit: Mapped[int] = mapped_column(Integer, nullable=True)
 
     taught_lectures = relationship('Lecture', back_populates='teacher_info')
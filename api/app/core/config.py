@@ -1,22 +1,29 @@
 from pydantic import computed_field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+DEFAULT_PORTS = {'mariadb': 3306, 'mysql': 3306, 'postgresql': 5432}
 
 class Configs(BaseSettings):
 
     DEBUG: bool
 
-    SQL_ROOT_PASSWORD: str
-    SQL_DATABASE: str
-    SQL_USER: str
-    SQL_PASSWORD: str
+    SQL_DRIVER: str = 'mariadb+aiomysql' # postgresql+asyncpg, sqlite+aiosqlite
+    SQL_ROOT_PASSWORD: str = ''
+    SQL_DATABASE: str # file path for sqlite
+    SQL_USER: str = ''
+    SQL_PASSWORD: str = ''
     SQL_HOST: str = 'db'
-    SQL_PORT: int = 3306
+    SQL_PORT: int | None = None # default port of the backend
 
     @computed_field
     @property
     def DATABASE_URL(self) -> str:
-        return f'mariadb+aiomysql://{self.SQL_USER}:{self.SQL_PASSWORD}@{self.SQL_HOST}:{self.SQL_PORT}/{self.SQL_DATABASE}'
+        backend = self.SQL_DRIVER.split('+')[0]
+        if backend == 'sqlite':
+            return f'{self.SQL_DRIVER}:///{self.SQL_DATABASE}'
+
+        port = self.SQL_PORT or DEFAULT_PORTS.get(backend)
+        return f'{self.SQL_DRIVER}://{self.SQL_USER}:{self.SQL_PASSWORD}@{self.SQL_HOST}:{port}/{self.SQL_DATABASE}'
 
     JWT_SECRET: str
     JWT_ALGORITHM: str = "HS256"
@@ -29,6 +36,18 @@ class Configs(BaseSettings):
     THEME_DEFAULT_COLOR: str = '#2B2A2A'
     THEME_DEFAULT_TEXT_COLOR: str = '#EEEEEE'
 
+    UPLOAD_PARSE_WORKERS: int | None = None # defaults to the number of cores
+    UPLOAD_CHUNK_ROWS: int = 1000
+    UPLOAD_CHUNK_BYTES: int = 1024 * 1024 # well below the max_allowed_packet of MariaDB
+    UPLOAD_COPY: bool = True # COPY for enrollments and periods on postgresql+asyncpg
+    UPLOAD_REJECT_CONFLICTS: bool = False # fail the upload instead of only reporting clashing timetables
+    UPLOAD_MAX_BYTES: int = 32 * 1024 * 1024 # per workbook
+    UPLOAD_CACHE_DIR: str = '~/.cache/timetable-upload' # created with mode 0700, ignored if others can write to it
+    UPLOAD_CACHE_BYTES: int = 256 * 1024 * 1024 # 0 disables the parse cache
+
+    TIMETABLE_CACHE_SIZE: int = 4096 # timetables kept per process, 0 disables the cache
+    TIMETABLE_WARM_CONCURRENCY: int = 4 # connections used to warm the cache after an upload
+
     model_config = SettingsConfigDict(
         env_file=".env",
         env_file_encoding='utf-8',
@@ -3,19 +3,24 @@ from typing import Any
 
 import ulid
 from sqlalchemy import (
-    TypeDecorator, BINARY, LargeBinary
+    TypeDecorator, BINARY, LargeBinary, Insert, ColumnElement, Table, literal_column
 )
+from sqlalchemy.dialects import mysql, postgresql, sqlite
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import DeclarativeBase
 
 from app.core.config import configs
 
-engine = create_async_engine(
+def create_engine(url: str, **kwargs):
+    # sqlite는 파일 하나라 커넥션 풀 크기를 둘 필요가 없음, NullPool처럼 풀을 직접 고르면 크기도 받지 않는다
+    if not url.startswith('sqlite') and 'poolclass' not in kwargs:
+        kwargs = {'pool_size': 20, 'max_overflow': 10} | kwargs
+
+    return create_async_engine(url, pool_pre_ping=True, **kwargs)
+
+engine = create_engine(
     configs.DATABASE_URL,
     echo=False, # 디버그 모드일 때 SQL 로그 출력
-    pool_pre_ping=True,
-    pool_size=20,
-    max_overflow=10
 )
 
 class ULID(TypeDecorator):
@@ -23,6 +28,12 @@ class ULID(TypeDecorator):
     impl = BINARY(16)
     cache_ok = True
 
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql': # PostgreSQL에는 BINARY가 없다
+            return dialect.type_descriptor(postgresql.BYTEA())
+
+        return dialect.type_descriptor(BINARY(16))
+
     def process_bind_param(self, value, dialect):
         if value is None:
             return None
@@ -71,6 +82,48 @@ class Hex(TypeDecorator):
         return binascii.hexlify(value).decode('utf-8')
 
 
+## ===== Upsert =====
+DIALECT_INSERTS = {
+    'mysql': mysql.insert,
+    'mariadb': mysql.insert,
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+# update가 없으면 키가 겹치는 행은 건너뛰고 (INSERT IGNORE / ON CONFLICT DO NOTHING), 있으면 해당 컬럼을 덮어쓴다
+# conflict는 기본이 primary key, MariaDB는 모든 unique key로 충돌을 판단하므로 무시됨
+def upsert(dialect: str, model: 'Table | type[Base]', update: tuple[str, ...] = None, conflict: tuple[str, ...] = None) -> Insert:
+    if dialect not in DIALECT_INSERTS:
+        raise NotImplementedError(f'upsert is not supported on {dialect}')
+
+    stmt = DIALECT_INSERTS[dialect](model)
+    table = model if isinstance(model, Table) else model.__table__ # staging 테이블처럼 모델이 없는 Table도 받는다
+    if dialect in ('mysql', 'mariadb'):
+        if not update:
+            return stmt.prefix_with('IGNORE')
+        return stmt.on_duplicate_key_update({c: stmt.inserted[c] for c in update})
+
+    conflict = conflict or tuple(c.name for c in table.primary_key.columns)
+    if not update:
+        return stmt.on_conflict_do_nothing(index_elements=conflict)
+    return stmt.on_conflict_do_update(index_elements=conflict, set_={c: stmt.excluded[c] for c in update})
+
+# INSERT ... SELECT처럼 DB가 행을 만들 때 쓰는 ULID, 앞 6바이트 밀리초 시각 + 10바이트 난수
+DIALECT_ULIDS = {
+    'mysql': "UNHEX(CONCAT(LPAD(HEX(FLOOR(UNIX_TIMESTAMP(NOW(3)) * 1000)), 12, '0'), HEX(RANDOM_BYTES(10))))",
+    'mariadb': "UNHEX(CONCAT(LPAD(HEX(FLOOR(UNIX_TIMESTAMP(NOW(3)) * 1000)), 12, '0'), HEX(RANDOM_BYTES(10))))",
+    'postgresql': "overlay(uuid_send(gen_random_uuid()) placing "
+                  "substring(int8send(floor(extract(epoch from clock_timestamp()) * 1000)::bigint) from 3) from 1 for 6)",
+    'sqlite': 'randomblob(16)', # unhex가 없는 버전도 있어서 시각 없이 난수만
+}
+
+def ulid_sql(dialect: str) -> ColumnElement:
+    if dialect not in DIALECT_ULIDS:
+        raise NotImplementedError(f'ulid generation is not supported on {dialect}')
+
+    return literal_column(DIALECT_ULIDS[dialect], ULID())
+
+
 ## Tables
 class Base(DeclarativeBase):
     pass
@@ -6,8 +6,9 @@ import uuid
 from json import JSONDecodeError
 
 import structlog
-from fastapi.exceptions import RequestValidationError
+from fastapi.exceptions import RequestValidationError, HTTPException
 from starlette import status
+from starlette.responses import JSONResponse
 from starlette.types import ASGIApp, Scope, Receive, Send, Message
 
 from app.util.logger import mask_sensitive_data
@@ -27,10 +28,12 @@ class RequestLogMiddleware:
 
         # === store context var ===
         request_id = None
+        content_type = b""
         for header, value in scope.get('headers', []):
             if header == b"x-request-id":
                 request_id = value.decode('latin1')
-                break
+            elif header == b"content-type":
+                content_type = value
 
         if not request_id:
             request_id = str(uuid.uuid4())
@@ -48,6 +51,7 @@ class RequestLogMiddleware:
         # === query json request ===
         request_body_chunk = []
         total_body_size = 0
+        keep_body = not content_type.startswith(b"multipart/") # 업로드 파일은 로그에 남기지 않음
 
         async def wrapped_receive() -> Message:
             nonlocal total_body_size
@@ -55,7 +59,7 @@ class RequestLogMiddleware:
 
             if message['type'] == 'http.request':
                 chunk = message.get('body', b"")
-                if total_body_size < MAX_BODY_SIZE:
+                if keep_body and total_body_size < MAX_BODY_SIZE:
                     request_body_chunk.append(chunk)
                     total_body_size += len(chunk)
 
@@ -105,7 +109,7 @@ class RequestLogMiddleware:
                 masked_body = mask_sensitive_data(body_json) if not self.debug else body_json
             else:
                 masked_body = None
-        except JSONDecodeError:
+        except (JSONDecodeError, UnicodeDecodeError):
             masked_body = f'Cannot parse body JSON (len={len(body)})'
 
         ## === read header ===
@@ -144,4 +148,44 @@ class RequestLogMiddleware:
         if error:
             logger.error('Request failed with exception', exc_info=error, **log_payload)
         else:
-            logger.warning('Request failed', **log_payload)
\ No newline at end of file
+            logger.warning('Request failed', **log_payload)
+
+class BodyLimitMiddleware:
+    # 경로별 요청 본문 크기 제한, multipart는 handler가 돌기 전에 다 받아서 디스크에 쓰므로 그 전에 막는다
+
+    def __init__(self, app: ASGIApp, limits: dict[str, int]):
+        self.app = app
+        self.limits = limits # path prefix -> max bytes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        limit = None
+        if scope['type'] == 'http':
+            limit = next((v for k, v in self.limits.items() if scope['path'].startswith(k)), None)
+        if limit is None:
+            return await self.app(scope, receive, send)
+
+        # Content-Length가 있으면 본문을 읽기 전에 거절한다
+        for header, value in scope.get('headers', []):
+            if header == b'content-length' and value.isdigit() and int(value) > limit:
+                response = JSONResponse(status_code=status.HTTP_413_CONTENT_TOO_LARGE, content={
+                    'message': f'request body is larger than {limit} bytes',
+                    'code': 'BODY_TOO_LARGE',
+                    'max_bytes': limit,
+                })
+                return await response(scope, receive, send)
+
+        # 없거나 거짓이면 받는 만큼 세다가 넘는 순간 멈춘다
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > limit:
+                    raise HTTPException(status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+                                        detail=f'request body is larger than {limit} bytes')
+
+            return message
+
+        await self.app(scope, limited_receive, send)
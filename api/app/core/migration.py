@@ -0,0 +1,86 @@
+import re
+
+import structlog
+from sqlalchemy import Connection, inspect, select, update, text
+
+from app.core.database import Base
+from app.timetable.model import Lecture
+
+logger = structlog.get_logger()
+
+# create_all은 없는 테이블만 만든다, 이미 있는 테이블에 나중에 추가한 것은 여기서 맞춘다
+def create_missing_indexes(connection: Connection) -> list[str]:
+    inspector = inspect(connection)
+    created = []
+    for table in Base.metadata.tables.values():
+        if not inspector.has_table(table.name):
+            continue
+
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(connection)
+                created.append(index.name)
+
+    if created:
+        logger.info('missing indexes created', indexes=created)
+    return created
+
+def create_missing_columns(connection: Connection) -> list[str]:
+    # nullable이거나 server default가 있는 열만 더할 수 있다, 나머지는 있는 행을 채울 값이 없다
+    inspector = inspect(connection)
+    compiler = connection.dialect.ddl_compiler(connection.dialect, None)
+    created = []
+    for table in Base.metadata.tables.values():
+        if not inspector.has_table(table.name):
+            continue
+
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable and column.server_default is None:
+                logger.warning('missing column is not created, it has no default', table=table.name, column=column.name)
+                continue
+
+            connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {compiler.get_column_specification(column)}'))
+            created.append(f'{table.name}.{column.name}')
+
+    if created:
+        logger.info('missing columns created', columns=created)
+    return created
+
+LEGACY_ROOM = re.compile(r'(-?\d+)\.0')
+
+# pandas로 읽던 때는 빈 칸이 섞인 숫자 열이 float이 되어 교실이 '101.0'으로 저장되었다, 지금은 '101'로 읽으므로
+# 그대로 두면 같은 강의를 다시 올릴 때 (과목, 교사, 교실)이 달라 강의와 수업이 새로 생긴다
+def normalize_lecture_rooms(connection: Connection) -> int:
+    stmt = select(Lecture.lecture_id, Lecture.subject_id, Lecture.teacher_info_id, Lecture.room)
+    legacy = connection.execute(stmt.where(Lecture.room.like('%.0'))).all()
+    legacy = [(row, m.group(1)) for row in legacy if (m := LEGACY_ROOM.fullmatch(row.room))]
+    if not legacy:
+        return 0
+
+    rooms = {room for _, room in legacy}
+    existing = {(row.subject_id, row.teacher_info_id, row.room)
+                for row in connection.execute(stmt.where(Lecture.room.in_(rooms)))}
+
+    normalized = 0
+    for row, room in legacy:
+        key = (row.subject_id, row.teacher_info_id, room)
+        if key in existing: # 같은 강의가 이미 두 개로 나뉘었으면 합치는 것은 사람이 판단한다
+            logger.warning('lecture room is not normalized, the normalized lecture exists',
+                           lecture_id=str(row.lecture_id), room=row.room)
+            continue
+
+        connection.execute(update(Lecture).where(Lecture.lecture_id == row.lecture_id).values(room=room))
+        existing.add(key)
+        normalized += 1
+
+    logger.info('lecture rooms normalized', lectures=normalized)
+    return normalized
+
+def migrate(connection: Connection):
+    create_missing_columns(connection)
+    create_missing_indexes(connection)
+    normalize_lecture_rooms(connection)
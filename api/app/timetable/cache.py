@@ -0,0 +1,29 @@
+from collections import OrderedDict
+
+from typing import Any
+
+import ulid
+
+from app.core.config import configs
+
+# (user_id, timetable_version) -> 응답, 버전이 바뀌면 예전 항목은 다시 읽히지 않고 밀려난다
+# ORM 객체 대신 model_dump()한 dict를 넣는다, 세션이 닫힌 뒤에도 그대로 쓸 수 있고 요청끼리 같은 객체를 고치지 않는다
+# 프로세스마다 따로 있는 캐시라 업로드 뒤 warmup은 job을 돌린 worker만 채운다, 다른 worker는 첫 요청 때 채운다
+timetables: OrderedDict[tuple[ulid.ULID, ulid.ULID], dict[str, Any]] = OrderedDict()
+
+def get_cached(user_id: ulid.ULID, version: ulid.ULID) -> dict[str, Any] | None:
+    timetable = timetables.get((user_id, version))
+    if timetable is not None:
+        timetables.move_to_end((user_id, version))
+
+    return timetable
+
+def store(user_id: ulid.ULID, version: ulid.ULID, timetable: dict[str, Any]):
+    if configs.TIMETABLE_CACHE_SIZE <= 0 or version is None:
+        return
+
+    timetables[(user_id, version)] = timetable
+    timetables.move_to_end((user_id, version))
+    while len(timetables) > configs.TIMETABLE_CACHE_SIZE:
+        timetables.popitem(last=False)
+
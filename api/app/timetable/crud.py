@@ -1,13 +1,26 @@
+import asyncio
+import time
+from itertools import batched
+from typing import Callable, Iterable
+
+import structlog
+import ulid
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload, joinedload
 from ulid.ulid import ULID
 
 from app.auth.model import User, UserInfo
+from app.core.config import configs
+from app.core.database import AsyncSessionLocal
+from app.sync.model import SyncStatus
+from app.timetable import cache
 from app.timetable.exceptions import UnknownClassError
 from app.timetable.model import Class, Lecture
 from app.timetable.schemas import TimetableSchema
 
+logger = structlog.get_logger()
+
 
 async def query_timetable(user: User, session: AsyncSession):
     stmt = (
@@ -31,6 +44,17 @@ async def query_timetable(user: User, session: AsyncSession):
         timetable=user_info.classes
     )
 
+async def query_cached_timetable(user: User, session: AsyncSession):
+    stmt = select(SyncStatus.timetable_version).where(SyncStatus.user_id == user.user_id)
+    version = (await session.execute(stmt)).scalar()
+
+    timetable = cache.get_cached(user.user_id, version)
+    if timetable is None:
+        timetable = (await query_timetable(user, session)).model_dump()
+        cache.store(user.user_id, version, timetable)
+
+    return timetable
+
 async def query_class(class_id: ULID, session: AsyncSession):
     stmt = select(Class).options(
         selectinload(Class.classmates),
@@ -43,4 +67,42 @@ async def query_class(class_id: ULID, session: AsyncSession):
     if result is None:
         raise UnknownClassError('Cannot find class for ' + str(class_id))
 
-    return result
\ No newline at end of file
+    return result
+
+
+async def warm_timetables(
+        user_info_ids: Iterable[ulid.ULID],
+        progress: Callable[[int], None] = None,
+        concurrency: int = None
+) -> int:
+    # 업로드 직후 아침에 몰리는 첫 요청 대신 미리 계산해 둔다, 커넥션은 concurrency개만 쓴다
+    concurrency = concurrency or configs.TIMETABLE_WARM_CONCURRENCY
+    started_at = time.perf_counter()
+
+    async with AsyncSessionLocal() as session:
+        users = []
+        for chunk in batched(user_info_ids, configs.UPLOAD_CHUNK_ROWS):
+            stmt = (select(User.user_id, User.username, User.user_info_id, SyncStatus.timetable_version)
+                    .join(SyncStatus, SyncStatus.user_id == User.user_id)
+                    .where(User.user_info_id.in_(chunk)))
+            users += (await session.execute(stmt)).all()
+
+    pending = iter(users) # worker들이 나눠 가져간다
+    warmed = 0
+
+    async def worker():
+        nonlocal warmed
+        async with AsyncSessionLocal() as session:
+            for user_id, username, user_info_id, version in pending:
+                user = User(user_id=user_id, username=username, user_info_id=user_info_id)
+                cache.store(user_id, version, (await query_timetable(user, session)).model_dump())
+                session.expunge_all()
+
+                warmed += 1
+                if progress is not None:
+                    progress(1)
+
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, len(users)))))
+
+    logger.info('timetables warmed', users=warmed, concurrency=concurrency, elapsed=time.perf_counter() - started_at)
+    return warmed
@@ -8,7 +8,7 @@ from app.core.response import create_response, BaseResponse
 from app.core.types import ULIDModel
 from app.sync.dependencies import get_status_dependency
 from app.sync.schemas import VersionResponse
-from app.timetable.crud import query_timetable, query_class
+from app.timetable.crud import query_cached_timetable, query_class
 from app.timetable.schemas import TimetableSchema, ClassSchema
 
 router = APIRouter()
@@ -26,7 +26,7 @@ async def get_timetable(
         user: User = Depends(get_current_user),
         session: AsyncSession = Depends(conn)
 ):
-    timetable = await query_timetable(user, session)
+    timetable = await query_cached_timetable(user, session)
 
     return create_response(timetable, user.user_id)
 
@@ -1,7 +1,7 @@
 from typing import List, Any
 
 import ulid.ulid
-from pydantic import BaseModel, ConfigDict, Field, computed_field
+from pydantic import BaseModel, ConfigDict, Field, model_validator
 from pydantic import field_validator
 
 from app.auth.schemas import UserSchema, UserInfoSchema
@@ -33,23 +33,27 @@ class ClassSchema(BaseModel):
     periods: List[PeriodSchema]
     classmates: List[UserInfoSchema]
 
-    lecture: Any = Field(exclude=True)
+    subject: str
+    teacher: str | None
+    room: str | None
 
-    # 중첩된 관계에서 데이터 추출 (Flattening)
-    @computed_field
-    @property
-    def subject(self) -> str:
-        return self.lecture.subject.name
-
-    @computed_field
-    @property
-    def teacher(self) -> str:
-        return self.lecture.teacher_info.name
-
-    @computed_field
-    @property
-    def room(self) -> str:
-        return self.lecture.room
+    # 중첩된 관계에서 데이터 추출 (Flattening), ORM 객체를 들고 있지 않아서 캐시에 넣어도 세션과 상관없다
+    @model_validator(mode="before")
+    @classmethod
+    def flatten_lecture(cls, v: Any):
+        lecture = getattr(v, 'lecture', None)
+        if lecture is None:
+            return v
+
+        return {
+            'class_id': v.class_id,
+            'division': v.division,
+            'periods': v.periods,
+            'classmates': v.classmates,
+            'subject': lecture.subject.name,
+            'teacher': lecture.teacher_info.name if lecture.teacher_info is not None else None,
+            'room': lecture.room,
+        }
 
     @field_validator("class_id", mode="before")
     @classmethod
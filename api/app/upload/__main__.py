@@ -0,0 +1,122 @@
+import argparse
+import asyncio
+import time
+
+import structlog
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+import app.auth.model
+import app.sync.model
+import app.theme.model
+import app.timetable.model
+import app.upload.model
+from app.core.config import configs
+from app.core.database import Base
+from app.core.migration import migrate
+from app.upload.metrics import Measurement, report, peak_rss_bytes
+from app.upload.jobs import UploadJob, import_workbooks
+from app.upload.pool import parse_workbooks, shutdown_executor
+from app.upload.template import unify_periods
+from app.util.logger import configure_logger
+
+logger = structlog.get_logger()
+
+# 웹 서버 밖에서 대량 업로드, uvicorn worker와 커넥션 풀을 나눠 쓰지 않는다
+async def parse_only(paths: tuple[str, str, str]) -> list[Measurement]:
+    started_at = time.perf_counter()
+    enrollments, periods, lectures, multi_tch_periods = await parse_workbooks(*paths)
+    parsed_at = time.perf_counter()
+    periods = unify_periods(periods, multi_tch_periods, lectures)
+    finished_at = time.perf_counter()
+
+    return [
+        Measurement('parse_workbooks', len(enrollments) + len(lectures) + len(multi_tch_periods),
+                    parsed_at - started_at),
+        Measurement('unify_periods', len(periods), finished_at - parsed_at),
+    ]
+
+async def upload(
+        paths: tuple[str, str, str],
+        database_url: str,
+        diff: bool,
+        create_tables: bool,
+        generations: list[int] = None,
+        swap: bool = False,
+        touch_all: bool = False
+) -> list[Measurement]:
+    engine = create_async_engine(database_url, pool_pre_ping=True)
+    sessionmaker = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False, autoflush=False)
+
+    try:
+        if create_tables:
+            async with engine.begin() as connection:
+                await connection.run_sync(Base.metadata.create_all)
+                await connection.run_sync(migrate)
+
+        job = UploadJob()
+        try:
+            async with sessionmaker() as session:
+                await import_workbooks(job, *paths, session, diff=diff, generations=generations, swap=swap,
+                                       touch_all=touch_all)
+        except Exception as e:
+            job.fail(e)
+            raise
+
+        job.finish()
+    finally:
+        await engine.dispose()
+
+    if job.skipped:
+        print('workbooks are unchanged, nothing uploaded')
+
+    return ([Measurement(s.stage, s.rows, s.elapsed) for s in job.stages] +
+            [Measurement('total', job.rows, job.elapsed)])
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m app.upload', description='import timetable workbooks')
+    parser.add_argument('enrollment', help='enrollment workbook')
+    parser.add_argument('lecture', help='lecture workbook')
+    parser.add_argument('period', help='period workbook')
+    parser.add_argument('--database-url', default=configs.DATABASE_URL)
+    parser.add_argument('--parse-only', action='store_true', help='time parsing without touching the database')
+    parser.add_argument('--diff', action='store_true', help='write only changed enrollments and periods')
+    parser.add_argument('--generation', type=int, action='append', dest='generations',
+                        help='upload only this generation, can be repeated')
+    parser.add_argument('--swap', action='store_true',
+                        help='load enrollments and periods into staging tables and swap them in at the end')
+    parser.add_argument('--touch-all', action='store_true',
+                        help='treat every uploaded row as changed, bumping every student and backfilling every theme')
+    parser.add_argument('--create-tables', action='store_true', help='create missing tables first')
+    parser.add_argument('--no-cache', action='store_true', help='ignore the parse cache')
+    parser.add_argument('--no-copy', action='store_true', help='use batched inserts instead of COPY on PostgreSQL')
+    parser.add_argument('--workers', type=int, default=configs.UPLOAD_PARSE_WORKERS, help='parse processes')
+    parser.add_argument('--chunk-rows', type=int, default=configs.UPLOAD_CHUNK_ROWS, help='rows per insert batch')
+    parser.add_argument('--chunk-bytes', type=int, default=configs.UPLOAD_CHUNK_BYTES, help='bytes per insert batch')
+    args = parser.parse_args()
+
+    configure_logger(json=False)
+
+    configs.UPLOAD_PARSE_WORKERS = args.workers
+    configs.UPLOAD_CHUNK_ROWS = args.chunk_rows
+    configs.UPLOAD_CHUNK_BYTES = args.chunk_bytes
+    if args.no_cache:
+        configs.UPLOAD_CACHE_BYTES = 0
+    if args.no_copy:
+        configs.UPLOAD_COPY = False
+
+    paths = (args.enrollment, args.lecture, args.period)
+    try:
+        if args.parse_only:
+            results = asyncio.run(parse_only(paths))
+        else:
+            results = asyncio.run(upload(paths, args.database_url, args.diff, args.create_tables, args.generations,
+                                         args.swap, args.touch_all))
+    finally:
+        shutdown_executor()
+
+    report(results + [Measurement('rss[main]', 0, 0.0, peak_rss_bytes())])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,320 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import random
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import structlog
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+
+import app.auth.model
+import app.sync.model
+import app.theme.model
+import app.timetable.model
+import app.upload.model
+from app.core.config import configs
+from app.auth.crud import Role
+from app.auth.model import UserInfo, User
+from app.core.database import engine, Base, AsyncSessionLocal, create_engine, generate_ulid
+from app.sync.model import SyncStatus
+from app.theme.model import Theme
+from app.timetable.model import Enrollment, Period
+from app.upload.bulk import bulk_insert
+from app.upload.jobs import UploadJob, JobStage, import_workbooks
+from app.upload.metrics import Measurement, report, peak_rss_bytes
+from app.upload.pool import parse_workbooks, shutdown_executor
+from app.upload.synthetic import SyntheticSpec, generate
+from app.upload.template import parse_enrollments, parse_lectures, parse_periods, unify_periods
+
+logger = structlog.get_logger()
+
+RESULTS_DIR = Path('benchmarks')
+
+def measure(name: str, fn, *args) -> tuple[Measurement, object]:
+    tracemalloc.start()
+    started_at = time.perf_counter()
+    try:
+        result = fn(*args)
+        elapsed = time.perf_counter() - started_at
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return Measurement(name, len(result), elapsed, peak), result
+
+def bench_parse(paths: tuple[str, str, str]) -> list[Measurement]:
+    enrollment_path, lecture_path, period_path = paths
+
+    parse_enrollment, (enrollments, periods) = measure('parse_enrollments', parse_enrollments, enrollment_path)
+    parse_lecture, lectures = measure('parse_lectures', parse_lectures, lecture_path)
+    parse_period, multi_tch_periods = measure('parse_periods', parse_periods, period_path)
+    unify, _ = measure('unify_periods', unify_periods, periods, multi_tch_periods, lectures)
+
+    parse_enrollment.rows = len(enrollments) # measure counts the tuple
+    return [parse_enrollment, parse_lecture, parse_period, unify]
+
+PARSERS = {
+    'parse_enrollments': lambda path: parse_enrollments(path)[0],
+    'parse_lectures': parse_lectures,
+    'parse_periods': parse_periods,
+}
+
+def parse_in_process(name: str, path: str) -> tuple[int, float, int]:
+    started_at = time.perf_counter()
+    rows = len(PARSERS[name](path))
+    return rows, time.perf_counter() - started_at, peak_rss_bytes()
+
+def bench_rss(paths: tuple[str, str, str]) -> list[Measurement]:
+    # 최대 RSS는 줄지 않으므로 파서마다 새 프로세스에서 잰다, tracemalloc과 달리 numpy와 openpyxl의 메모리도 잡힌다
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for name, path in zip(PARSERS, paths):
+        with ProcessPoolExecutor(1, mp_context=context) as executor:
+            rows, elapsed, peak = executor.submit(parse_in_process, name, path).result()
+        results.append(Measurement(f'rss[{name}]', rows, elapsed, peak))
+
+    return results
+
+async def bench_pool(paths: tuple[str, str, str]) -> Measurement:
+    started_at = time.perf_counter()
+    enrollments, _, _, _ = await parse_workbooks(*paths)
+    return Measurement('parse_workbooks', len(enrollments), time.perf_counter() - started_at)
+
+async def create_accounts() -> int:
+    # 가입한 학생이 있어야 버전을 올리고 테마를 채우는 stage가 실제로 일한다, 학생마다 계정 하나와 테마 하나
+    async with AsyncSessionLocal() as session:
+        stmt = (select(UserInfo.user_info_id)
+                .where(UserInfo.role.op('&')(Role.STUDENT) != 0, ~UserInfo.user.has()))
+        students = (await session.execute(stmt)).scalars().all()
+
+        users, statuses, themes = [], [], []
+        for user_info_id in students:
+            user_id = generate_ulid()
+            users.append({'user_id': user_id, 'username': f'bench-{user_id.str[-12:]}', 'password': '',
+                          'email': '', 'user_info_id': user_info_id})
+            statuses.append({'user_id': user_id, 'timetable_version': generate_ulid(), 'theme_version': generate_ulid()})
+            themes.append({'theme_id': generate_ulid(), 'owner_id': user_id, 'title': 'bench', 'published': False})
+
+        await bulk_insert(session, User, users)
+        await bulk_insert(session, SyncStatus, statuses)
+        await bulk_insert(session, Theme, themes)
+        await session.commit()
+
+    return len(students)
+
+async def bench_upload(
+        paths: tuple[str, str, str],
+        rounds: int,
+        swap: bool = False,
+        readers: int = 0,
+        idle: float = 2.0,
+        touch_all: bool = False
+) -> list[Measurement]:
+    results = []
+    load = None
+    windows = []
+    for round in range(rounds):
+        if round == 1:
+            await create_accounts()
+        if readers and round == 1: # round 0 fills the tables the readers pick students from
+            load = ReadLoad(readers)
+            await asyncio.sleep(idle)
+            windows.append(('idle', load.started_at, time.time()))
+
+        job = UploadJob()
+        tracemalloc.start()
+        started_at = time.time()
+        try:
+            async with AsyncSessionLocal() as session:
+                await import_workbooks(job, *paths, session, swap=swap, touch_all=touch_all)
+            job.finish()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        finished_at = time.time()
+        windows.append((f'upload[{round}]', started_at, finished_at))
+        offset = finished_at - time.perf_counter() # stage 시각은 perf_counter 기준
+        for stage in job.stages:
+            if stage.stage == JobStage.SWAP: # RENAME부터 잠금을 놓는 커밋까지
+                windows.append((f'upload[{round}].swap', offset + stage.started_at, finished_at))
+
+        # round 0 is a fresh import when --reset is given, later rounds re-import the same rows
+        for stage in job.stages:
+            results.append(Measurement(f'upload[{round}].{stage.stage}', stage.rows, stage.elapsed))
+        results.append(Measurement(f'upload[{round}]', job.rows, job.elapsed, peak))
+
+    if load is not None:
+        results += load.stop(windows)
+
+    return results
+
+
+## ===== Read Load =====
+# GET /timetable이 읽는 테이블을 다른 프로세스에서 계속 읽어서, 업로드 중 읽기 지연이 늘어나는지 본다
+# swap 중 읽기 지연은 PostgreSQL에서만 재었다, MariaDB의 RENAME TABLE swap은 서버가 없어 재지 않았다
+READ_SAMPLE = 1000
+READ_TIMEOUT = 60 # 읽기 프로세스가 죽었으면 기다리지 않고 실패한다
+
+async def read_loop(database_url: str, readers: int, ready, stop) -> list[tuple[float, float]]:
+    engine = create_engine(database_url)
+    async with engine.connect() as connection:
+        stmt = select(UserInfo.user_info_id).where(UserInfo.role.op('&')(Role.STUDENT) != 0).limit(READ_SAMPLE)
+        students = (await connection.execute(stmt)).scalars().all()
+        await connection.rollback()
+    ready.set()
+
+    stmt = (select(Enrollment.class_id, Period.day, Period.period)
+            .join(Period, Period.class_id == Enrollment.class_id))
+    samples = [] # (wall clock at start, latency)
+
+    async def reader(seed: int):
+        rnd = random.Random(seed)
+        async with engine.connect() as connection:
+            while not stop.is_set():
+                # 시작한 시각으로 센다, swap에 막힌 읽기는 커밋 뒤에 끝나도 swap 구간에 들어간다
+                wall, started_at = time.time(), time.perf_counter()
+                try:
+                    await connection.execute(stmt.where(Enrollment.user_info_id == rnd.choice(students)))
+                except OperationalError: # SQLite는 쓰기 잠금을 busy timeout까지 기다리다 실패한다, 막힌 시간을 그대로 센다
+                    pass
+                await connection.rollback() # 다음 읽기는 새 snapshot에서
+                samples.append((wall, time.perf_counter() - started_at))
+                await asyncio.sleep(0)
+
+    try:
+        await asyncio.gather(*(reader(seed) for seed in range(readers)))
+    finally:
+        await engine.dispose()
+
+    return samples
+
+def read_process(database_url: str, readers: int, ready, stop, results):
+    results.put(asyncio.run(read_loop(database_url, readers, ready, stop)))
+
+class ReadLoad:
+
+    def __init__(self, readers: int):
+        context = multiprocessing.get_context('spawn')
+        ready = context.Event()
+        self.stop_event = context.Event()
+        self.results = context.Queue()
+        self.process = context.Process(target=read_process, daemon=True,
+                                       args=(configs.DATABASE_URL, readers, ready, self.stop_event, self.results))
+        self.process.start()
+        ready.wait()
+        self.started_at = time.time()
+
+    def stop(self, windows: list[tuple[str, float, float]]) -> list[Measurement]:
+        self.stop_event.set()
+        samples = np.array(self.results.get(timeout=READ_TIMEOUT), dtype=float).reshape(-1, 2)
+        self.process.join()
+
+        # elapsed of a read measurement is the read latency at the percentile, not a duration
+        results = []
+        for name, started_at, finished_at in windows:
+            latencies = samples[(samples[:, 0] >= started_at) & (samples[:, 0] <= finished_at), 1]
+            if not len(latencies):
+                continue
+            for q in (50, 99):
+                results.append(Measurement(f'reads[{name}].p{q}', len(latencies), float(np.percentile(latencies, q))))
+
+        return results
+
+
+def git_commit() -> str | None:
+    try:
+        output = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True, stderr=subprocess.DEVNULL)
+        return output.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def save_results(
+        spec: SyntheticSpec,
+        results: list[Measurement],
+        directory: Path = RESULTS_DIR,
+        swap: bool = False
+) -> Path:
+    commit = git_commit()
+    created_at = datetime.now(timezone.utc)
+
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f'{created_at:%Y%m%dT%H%M%S}-{commit or "unknown"}.json'
+    path.write_text(json.dumps({
+        'commit': commit,
+        'created_at': created_at.isoformat(),
+        'spec': asdict(spec),
+        'database': engine.dialect.name,
+        'copy': configs.UPLOAD_COPY,
+        'swap': swap,
+        'results': [r.to_dict() for r in results],
+    }, indent=2, ensure_ascii=False))
+
+    return path
+
+async def run(args):
+    spec = SyntheticSpec(students=args.students, subjects=args.subjects, divisions=args.divisions,
+                         multi_teacher=args.multi_teacher, seed=args.seed)
+    configs.UPLOAD_CACHE_BYTES = 0 # parse cache would hide the parse cost
+    configs.UPLOAD_COPY = not args.no_copy
+
+    with tempfile.TemporaryDirectory(prefix='upload-bench-') as directory:
+        paths = generate(directory, spec)
+
+        results = bench_parse(paths) + bench_rss(paths)
+        results.append(await bench_pool(paths))
+
+        if not args.skip_db:
+            async with engine.begin() as connection:
+                if args.reset:
+                    await connection.run_sync(Base.metadata.drop_all)
+                await connection.run_sync(Base.metadata.create_all)
+
+            results += await bench_upload(paths, args.rounds, args.swap, args.readers, touch_all=args.touch_all)
+            await engine.dispose()
+
+    results.append(Measurement('rss[main]', 0, 0.0, peak_rss_bytes()))
+
+    report(results, args.compare)
+    print('saved to', save_results(spec, results, args.output, args.swap))
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark parsing and uploading of synthetic workbooks')
+    parser.add_argument('--students', type=int, default=1000)
+    parser.add_argument('--subjects', type=int, default=30)
+    parser.add_argument('--divisions', type=int, default=3)
+    parser.add_argument('--multi-teacher', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--rounds', type=int, default=2, help='number of imports of the same workbooks')
+    parser.add_argument('--skip-db', action='store_true', help='benchmark parsing only')
+    parser.add_argument('--no-copy', action='store_true', help='use batched inserts instead of COPY on PostgreSQL')
+    parser.add_argument('--swap', action='store_true', help='upload through staging tables swapped in at the end')
+    parser.add_argument('--readers', type=int, default=0,
+                        help='concurrent readers measuring read latency during uploads after the first round')
+    parser.add_argument('--touch-all', action='store_true',
+                        help='bump every student on every round, otherwise re-imports change nothing')
+    parser.add_argument('--reset', action='store_true', help='drop and recreate every table first, DEBUG only')
+    parser.add_argument('--output', type=Path, default=RESULTS_DIR)
+    parser.add_argument('--compare', type=Path, help='previous result file to compare against')
+    args = parser.parse_args()
+
+    if args.reset and not configs.DEBUG:
+        parser.error('--reset drops every table, it is only allowed with DEBUG')
+
+    try:
+        asyncio.run(run(args))
+    finally:
+        shutdown_executor()
+
+
+if __name__ == '__main__':
+    main()
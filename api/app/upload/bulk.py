@@ -0,0 +1,202 @@
+import time
+from itertools import batched, chain
+from typing import Iterable, Callable
+
+import structlog
+import ulid
+from sqlalchemy import insert, delete, select, tuple_, text, ColumnElement, Table
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import configs
+from app.core.database import upsert, generate_ulid
+from app.upload.schema import DiffResult
+
+logger = structlog.get_logger()
+
+ROW_OVERHEAD = 8 # parentheses, commas and separators of a VALUES tuple
+
+def estimate_size(row: dict) -> int:
+    size = ROW_OVERHEAD
+    for value in row.values():
+        if isinstance(value, ulid.ULID):
+            value = value.bytes
+
+        if isinstance(value, bytes):
+            size += len(value) * 2 + 3 # escaped binary literal
+        else:
+            size += len(str(value)) + 2
+
+    return size
+
+def iter_chunks(rows: Iterable[dict], max_rows: int = None, max_bytes: int = None):
+    max_rows = max_rows or configs.UPLOAD_CHUNK_ROWS
+    max_bytes = max_bytes or configs.UPLOAD_CHUNK_BYTES
+
+    chunk, size = [], 0
+    for row in rows:
+        row_size = estimate_size(row)
+        if chunk and (len(chunk) >= max_rows or size + row_size > max_bytes):
+            yield chunk
+            chunk, size = [], 0
+
+        chunk.append(row)
+        size += row_size
+
+    if chunk:
+        yield chunk
+
+
+def table_name(model) -> str:
+    return model.name if isinstance(model, Table) else model.__tablename__
+
+def copy_supported(session: AsyncSession) -> bool:
+    dialect = session.get_bind().dialect
+    return configs.UPLOAD_COPY and dialect.name == 'postgresql' and dialect.driver == 'asyncpg'
+
+def to_record(row: dict, columns: list[str]) -> tuple:
+    return tuple(row[c].bytes if isinstance(row[c], ulid.ULID) else row[c] for c in columns)
+
+async def copy_insert(session: AsyncSession, model, rows: Iterable[dict], ignore: bool = False) -> int:
+    # PostgreSQL 전용, binary COPY로 임시 테이블에 넣고 INSERT ... SELECT로 합친다
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return 0
+
+    table = table_name(model)
+    columns = list(first)
+    staging = f'{table}_copy_{generate_ulid().str.lower()}'
+    names = ', '.join(columns)
+
+    copied = 0
+    def records(): # 행을 목록으로 모으지 않고 COPY가 읽는 대로 넘긴다
+        nonlocal copied
+        for row in chain([first], rows):
+            copied += 1
+            yield to_record(row, columns)
+
+    started_at = time.perf_counter()
+    await session.execute(text(f'CREATE TEMP TABLE {staging} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP'))
+
+    connection = await (await session.connection()).get_raw_connection()
+    await connection.driver_connection.copy_records_to_table(staging, records=records(), columns=columns)
+
+    conflict = ' ON CONFLICT DO NOTHING' if ignore else ''
+    await session.execute(text(f'INSERT INTO {table} ({names}) SELECT {names} FROM {staging}{conflict}'))
+    await session.execute(text(f'DROP TABLE {staging}'))
+    elapsed = time.perf_counter() - started_at
+
+    logger.info('rows copied', table=table, rows=copied, rows_per_second=copied / elapsed if elapsed else None)
+    return copied
+
+async def bulk_insert(
+        session: AsyncSession,
+        model,
+        rows: Iterable[dict],
+        ignore: bool = False,
+        update: tuple[str, ...] = None,
+        copy: bool = False
+) -> int:
+    if copy and not update and copy_supported(session):
+        return await copy_insert(session, model, rows, ignore)
+
+    stmt = insert(model)
+    if ignore or update:
+        stmt = upsert(session.get_bind().dialect.name, model, update)
+
+    table = table_name(model)
+    total = 0
+    for index, chunk in enumerate(iter_chunks(rows)):
+        started_at = time.perf_counter()
+        await session.execute(stmt, chunk) # executemany, one batch per chunk
+        elapsed = time.perf_counter() - started_at
+
+        total += len(chunk)
+        logger.info('chunk inserted', table=table, chunk=index, rows=len(chunk),
+                    rows_per_second=len(chunk) / elapsed if elapsed else None)
+
+    if total:
+        logger.info('rows inserted', table=table, rows=total)
+
+    return total
+
+
+async def bulk_delete(session: AsyncSession, model, columns: tuple[str, ...], keys: Iterable[tuple]) -> int:
+    key = tuple_(*(getattr(model, c) for c in columns))
+
+    total = 0
+    for chunk in batched(keys, configs.UPLOAD_CHUNK_ROWS):
+        stmt = delete(model).where(key.in_(chunk)).execution_options(synchronize_session=False)
+        await session.execute(stmt)
+        total += len(chunk)
+
+    if total:
+        logger.info('rows deleted', table=model.__tablename__, rows=total)
+
+    return total
+
+async def insert_missing(
+        session: AsyncSession,
+        model,
+        columns: tuple[str, ...],
+        keys: Iterable[tuple],
+        copy: bool = False,
+        on_changed: Callable[[list[tuple]], None] = None
+) -> DiffResult:
+    # 지우지 않는 업로드, chunk마다 이미 있는 키만 찾아서 나머지를 넣는다, 전체 목록을 만들지 않는다
+    # 새로 넣은 키도 모으지 않고 chunk마다 on_changed로 넘긴다
+    columns_ = [getattr(model, c) for c in columns]
+    result = DiffResult()
+    for chunk in batched(keys, configs.UPLOAD_CHUNK_ROWS):
+        chunk = list(dict.fromkeys(chunk))
+        stmt = select(*columns_).where(tuple_(*columns_).in_(chunk))
+        existing = set((await session.execute(stmt)).tuples().all())
+
+        # 그 사이에 다른 프로세스가 넣은 행은 ignore로 넘긴다
+        added = [key for key in chunk if key not in existing]
+        await bulk_insert(session, model, (dict(zip(columns, key)) for key in added), ignore=True, copy=copy)
+
+        result.added += len(added)
+        result.kept += len(chunk) - len(added)
+        if on_changed is not None:
+            on_changed(added)
+
+    logger.info('missing rows inserted', table=model.__tablename__, result=str(result))
+    return result
+
+async def apply_diff(
+        session: AsyncSession,
+        model,
+        columns: tuple[str, ...],
+        targets: Iterable[tuple],
+        copy: bool = False,
+        scope: ColumnElement[bool] = None,
+        into: Table = None,
+        remove: bool = True,
+        on_changed: Callable[[list[tuple]], None] = None
+) -> DiffResult:
+    stmt = select(*(getattr(model, c) for c in columns))
+    if scope is not None:
+        # 범위 밖의 행은 비교하지도, 지우지도 않고 범위 안의 행만 잠근다
+        stmt = stmt.where(scope).with_for_update()
+    existing = set((await session.execute(stmt)).tuples().all())
+    targets = dict.fromkeys(targets)
+
+    added = [key for key in targets if key not in existing]
+    stale = [key for key in existing if key not in targets]
+    removed = stale if remove else [] # remove=False면 더하기만 한다
+
+    if into is None:
+        await bulk_insert(session, model, (dict(zip(columns, key)) for key in added), copy=copy)
+        await bulk_delete(session, model, columns, removed)
+    else: # 바뀐 행만 고치는 대신 범위 안의 결과 전체를 다른 테이블에 쓴다
+        rows = chain(targets, () if remove else stale)
+        await bulk_insert(session, into, (dict(zip(columns, key)) for key in rows), copy=copy)
+
+    if on_changed is not None: # 넣고 지운 키
+        on_changed(added)
+        on_changed(removed)
+
+    result = DiffResult(added=len(added), removed=len(removed), kept=len(existing) - len(removed))
+    logger.info('diff applied', table=model.__tablename__, result=str(result))
+    return result
@@ -0,0 +1,102 @@
+import hashlib
+import os
+import pickle
+import stat
+from datetime import datetime
+from pathlib import Path
+
+import structlog
+
+from app.core.config import configs
+from app.upload.template import TEMPLATE_VERSION
+
+logger = structlog.get_logger()
+
+SUFFIX = '.pickle'
+DIRECTORY_MODE = 0o700
+
+def cache_key(content_hash: str) -> str:
+    # 파싱할 때 학년을 올해 기준의 기수로 바꾸므로 (get_generation) 해가 바뀌면 같은 파일도 결과가 다르다
+    return hashlib.sha256(f'{content_hash}:{TEMPLATE_VERSION}:{datetime.now().year}'.encode()).hexdigest()
+
+def cache_dir() -> Path | None:
+    # pickle을 읽으므로 다른 사용자가 쓸 수 있는 디렉터리(미리 만들어 둔 것 포함)는 쓰지 않는다
+    directory = Path(configs.UPLOAD_CACHE_DIR).expanduser()
+    try:
+        directory.mkdir(mode=DIRECTORY_MODE, parents=True, exist_ok=True)
+        info = directory.lstat()
+    except OSError as e:
+        logger.warning('parse cache directory is not usable', directory=str(directory), error=str(e))
+        return None
+
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        logger.warning('parse cache directory is not private to this user, cache disabled', directory=str(directory),
+                       owner=info.st_uid, mode=oct(stat.S_IMODE(info.st_mode)))
+        return None
+
+    return directory
+
+def cache_path(directory: Path, key: str) -> Path:
+    return directory / f'{key}{SUFFIX}'
+
+
+def load_parsed(key: str):
+    if not configs.UPLOAD_CACHE_BYTES:
+        return None
+
+    directory = cache_dir()
+    if directory is None:
+        return None
+
+    path = cache_path(directory, key)
+    try:
+        with open(path, 'rb') as f:
+            parsed = pickle.load(f)
+    except FileNotFoundError:
+        logger.info('parse cache miss', key=key)
+        return None
+    except Exception as e:
+        logger.warning('broken parse cache entry', key=key, error=str(e))
+        path.unlink(missing_ok=True)
+        return None
+
+    os.utime(path) # mtime 기준 LRU
+    logger.info('parse cache hit', key=key)
+    return parsed
+
+def store_parsed(key: str, parsed):
+    if not configs.UPLOAD_CACHE_BYTES:
+        return
+
+    directory = cache_dir()
+    if directory is None:
+        return
+
+    path = cache_path(directory, key)
+
+    temp = path.with_suffix(f'.{os.getpid()}.tmp')
+    with open(temp, 'wb') as f:
+        pickle.dump(parsed, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp, path) # 동시에 쓰더라도 반쯤 쓴 파일은 보이지 않게
+
+    evict(directory)
+
+def evict(directory: Path, max_bytes: int = None):
+    max_bytes = max_bytes if max_bytes is not None else configs.UPLOAD_CACHE_BYTES
+
+    entries = []
+    for path in directory.glob(f'*{SUFFIX}'):
+        try:
+            info = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((info.st_mtime, info.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+
+        path.unlink(missing_ok=True)
+        total -= size
+        logger.info('parse cache evicted', path=str(path), size=size)
@@ -0,0 +1,65 @@
+from itertools import combinations
+
+import numpy as np
+import structlog
+
+from app.upload.schema import EnrollmentInfo, PeriodInfo, ScheduleConflict
+
+logger = structlog.get_logger()
+
+WORD_BITS = 64 # 칸이 64개를 넘으면 수업마다 uint64 word를 여러 개 쓴다
+WORD_MASK = (1 << WORD_BITS) - 1
+
+def class_masks(periods: list[PeriodInfo]) -> tuple[dict[tuple[str, int], int], list[tuple[int, int]]]:
+    # (day, period) 칸마다 bit 하나, 실제로 쓰인 칸만 번호를 매긴다
+    slots = sorted({(p.day, p.period) for p in periods})
+    bits = {slot: i for i, slot in enumerate(slots)}
+    masks = {}
+    for p in periods:
+        key = (p.subject, p.division)
+        masks[key] = masks.get(key, 0) | 1 << bits[(p.day, p.period)]
+
+    return masks, slots
+
+def to_words(mask: int, words: int) -> list[int]:
+    return [mask >> (WORD_BITS * w) & WORD_MASK for w in range(words)]
+
+def find_conflicts(enrollments: list[EnrollmentInfo], periods: list[PeriodInfo]) -> list[ScheduleConflict]:
+    masks, slots = class_masks(periods)
+    keys = list(masks)
+    index = {key: i for i, key in enumerate(keys)}
+    words = max(-(-len(slots) // WORD_BITS), 1)
+    table = np.array([to_words(mask, words) for mask in masks.values()], dtype=np.uint64).reshape(len(keys), words)
+
+    # 학생별 수업 mask를 한 배열로 펼쳐 reduceat으로 학생 단위 OR / popcount 합을 구한다
+    students = [e for e in enrollments if any(s in index for s in e.subjects)]
+    classes = [[index[s] for s in e.subjects if s in index] for e in students]
+    if not students:
+        return []
+
+    lengths = np.fromiter(map(len, classes), dtype=np.intp, count=len(classes))
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    flat = table[np.fromiter((i for c in classes for i in c), dtype=np.intp, count=int(lengths.sum()))]
+
+    union = np.bitwise_or.reduceat(flat, offsets, axis=0)
+    total = np.add.reduceat(np.bitwise_count(flat).sum(axis=1, dtype=np.intp), offsets)
+    clashing = np.flatnonzero(np.bitwise_count(union).sum(axis=1, dtype=np.intp) != total) # 겹치는 칸이 있으면 합이 더 크다
+
+    conflicts = []
+    for s in clashing:
+        student = students[s]
+        overlap, subjects = 0, {}
+        for a, b in combinations(classes[s], 2):
+            common = masks[keys[a]] & masks[keys[b]]
+            if common:
+                overlap |= common
+                subjects[keys[a]] = subjects[keys[b]] = None
+
+        conflicts.append(ScheduleConflict(
+            student.generation, student.clazz, student.number, student.name,
+            tuple(slot for i, slot in enumerate(slots) if overlap >> i & 1),
+            tuple(subjects),
+        ))
+
+    logger.info('schedule conflicts checked', students=len(students), classes=len(keys), conflicts=len(conflicts))
+    return conflicts
@@ -0,0 +1,105 @@
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Callable, Iterable
+
+import structlog
+import ulid
+from sqlalchemy import select, event, ColumnElement
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.auth.crud import Role
+from app.auth.model import UserInfo
+from app.timetable.model import Subject, Lecture, Class, Enrollment
+
+logger = structlog.get_logger()
+
+@dataclass
+class ImportContext:
+    session: AsyncSession
+
+    teachers: dict[str, ulid.ULID] = field(default_factory=dict) # name
+    students: dict[tuple, ulid.ULID] = field(default_factory=dict) # (generation, clazz, number, name)
+    subjects: dict[str, ulid.ULID] = field(default_factory=dict) # name
+    lectures: dict[tuple, ulid.ULID] = field(default_factory=dict) # (subject, teacher, room)
+    lecture_ids: dict[tuple, ulid.ULID] = field(default_factory=dict) # (subject, teacher)
+    lecture_subjects: dict[ulid.ULID, str] = field(default_factory=dict) # lecture_id -> subject
+    classes: dict[tuple, ulid.ULID] = field(default_factory=dict) # (lecture_id, division)
+    subject_classes: dict[tuple, list[ulid.ULID]] = field(default_factory=lambda: defaultdict(list)) # (subject, division)
+
+    generations: frozenset[int] | None = None # None means every generation
+    touch_all: bool = False # 실제로 바뀐 것과 상관없이 올린 전부를 바뀐 것으로
+    changed_classes: set[ulid.ULID] = field(default_factory=set) # 시간이나 수강생이 바뀐 수업
+    changed_students: set[ulid.ULID] = field(default_factory=set) # 수강 신청이 바뀐 학생
+    selects: int = 0
+
+    async def load(self):
+        # 각 stage에서 반복하던 조회를 한 번에, 필요한 컬럼만 가져온다
+        stmt = select(UserInfo.user_info_id, UserInfo.name).where(UserInfo.role.op('&')(Role.TEACHER) != 0)
+        for user_info_id, name in await self.session.execute(stmt):
+            self.teachers[name] = user_info_id
+
+        stmt = select(UserInfo.user_info_id, UserInfo.name, UserInfo.generation, UserInfo.clazz, UserInfo.number).where(
+            UserInfo.role.op('&')(Role.STUDENT) != 0
+        )
+        if self.generations is not None:
+            stmt = stmt.where(UserInfo.generation.in_(self.generations))
+        for user_info_id, name, generation, clazz, number in await self.session.execute(stmt):
+            self.students[(generation, clazz, number, name)] = user_info_id
+
+        stmt = select(Subject.subject_id, Subject.name)
+        for subject_id, name in await self.session.execute(stmt):
+            self.subjects[name] = subject_id
+
+        subject_names = {v: k for k, v in self.subjects.items()}
+        teacher_names = {v: k for k, v in self.teachers.items()}
+        stmt = select(Lecture.lecture_id, Lecture.subject_id, Lecture.teacher_info_id, Lecture.room)
+        for lecture_id, subject_id, teacher_id, room in await self.session.execute(stmt):
+            self.add_lecture(lecture_id, subject_names[subject_id], teacher_names.get(teacher_id), room)
+
+        stmt = select(Class.class_id, Class.lecture_id, Class.division)
+        for class_id, lecture_id, division in await self.session.execute(stmt):
+            self.add_class(class_id, lecture_id, division)
+
+        logger.info('import context loaded', teachers=len(self.teachers), students=len(self.students),
+                    subjects=len(self.subjects), lectures=len(self.lectures), classes=len(self.classes))
+
+    def add_lecture(self, lecture_id: ulid.ULID, subject: str, teacher: str, room: str):
+        self.lectures[(subject, teacher, room)] = lecture_id
+        self.lecture_ids[(subject, teacher)] = lecture_id
+        self.lecture_subjects[lecture_id] = subject
+
+    def add_class(self, class_id: ulid.ULID, lecture_id: ulid.ULID, division: int):
+        self.classes[(lecture_id, division)] = class_id
+        self.subject_classes[(self.lecture_subjects[lecture_id], division)].append(class_id)
+
+    def enrollments_changed(self, keys: Iterable[tuple]):
+        # 수강생이 바뀌면 같은 수업을 듣는 학생의 시간표(classmates)도 바뀐다
+        for class_id, student_id in keys:
+            self.changed_classes.add(class_id)
+            self.changed_students.add(student_id)
+
+    def periods_changed(self, keys: Iterable[tuple]):
+        self.changed_classes.update(key[0] for key in keys)
+
+    def student_scope(self) -> ColumnElement[bool] | None:
+        if self.generations is None:
+            return None
+
+        students = select(UserInfo.user_info_id).where(
+            UserInfo.role.op('&')(Role.STUDENT) != 0,
+            UserInfo.generation.in_(self.generations)
+        )
+        return Enrollment.user_info_id.in_(students)
+
+    def count_selects(self, callback: Callable[[], None] = None) -> Callable[[], None]:
+        # 커넥션이 아니라 session에 붙여서 중간에 커밋해 커넥션이 바뀌어도 계속 센다, 돌려준 함수로 뗀다
+        session = self.session.sync_session
+
+        def count(state):
+            if state.is_select:
+                self.selects += 1
+                if callback is not None:
+                    callback()
+
+        event.listen(session, 'do_orm_execute', count)
+        return lambda: event.remove(session, 'do_orm_execute', count)
@@ -1,4 +1,6 @@
-from app.core.exceptions import BasicError
+from starlette import status
+
+from app.core.exceptions import BasicError, ClientError
 
 
 class UploadError(BasicError):
@@ -6,3 +8,19 @@ class UploadError(BasicError):
 
 class ParseError(BasicError):
     pass
+
+
+class UnknownUploadJobError(ClientError):
+
+    code = 'UNKNOWN_UPLOAD_JOB'
+    status_code = status.HTTP_404_NOT_FOUND
+
+class UploadTooLargeError(ClientError):
+
+    code = 'UPLOAD_TOO_LARGE'
+    status_code = status.HTTP_413_CONTENT_TOO_LARGE
+
+class UnknownExportError(ClientError):
+
+    code = 'UNKNOWN_EXPORT'
+    status_code = status.HTTP_404_NOT_FOUND
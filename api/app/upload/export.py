@@ -0,0 +1,290 @@
+import argparse
+import asyncio
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import structlog
+import ulid
+from openpyxl import Workbook
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+
+from app.auth.crud import Role
+from app.auth.model import UserInfo
+from app.core.config import configs
+from app.timetable.model import Subject, Lecture, Class, Enrollment, Period
+from app.upload.template import template, template_room
+from app.util.common import get_grade, get_generation
+from app.util.logger import configure_logger
+
+logger = structlog.get_logger()
+
+# 업로드 양식 그대로 내보내서, 내보낸 파일을 다시 올리면 바뀌는 것이 없다
+PERIODS = template.height - 1 # 첫 행은 학번과 학점
+DAYS = template.width
+BLOCKS_PER_ROW = 4
+MAX_TEACHERS = (template_room.width - 1) // 2
+
+ENROLLMENT_TITLE = '수강 신청 현황'
+LECTURE_HEADER = ['과목'] + ['교사', '교실'] * MAX_TEACHERS
+PERIOD_HEADER = ['과목', '교사', '월', '화', '수', '목', '금']
+
+@dataclass(slots=True)
+class ExportClass:
+    subject: str
+    division: int
+    room: str | None
+    lecture_id: ulid.ULID
+    slots: list[tuple[int, int]] = field(default_factory=list) # (day, period)
+
+    @property
+    def label(self) -> str:
+        return f'{self.subject} {self.division}반 {self.room or ""}'
+
+
+class SheetWriter:
+    # openpyxl은 동기라 이벤트 루프에서 쓰면 내보내는 동안 다른 요청이 멈춘다, 행을 chunk로 모아 thread에서 쓴다
+    # write-only 시트는 append할 때 바로 임시 파일에 쓰므로 메모리에는 chunk 하나만 남는다
+
+    def __init__(self):
+        self.workbook = Workbook(write_only=True)
+        self.worksheet = self.workbook.create_sheet()
+        self.rows = []
+
+    async def append(self, row: list):
+        self.rows.append(row)
+        if len(self.rows) >= configs.UPLOAD_CHUNK_ROWS:
+            await self.flush()
+
+    async def flush(self):
+        rows, self.rows = self.rows, []
+        if rows:
+            await asyncio.to_thread(self._write, rows)
+
+    def _write(self, rows: list[list]):
+        for row in rows:
+            self.worksheet.append(row)
+
+    async def save(self, path):
+        await self.flush()
+        await asyncio.to_thread(self.workbook.save, path)
+
+
+def stream_options(stmt):
+    # server-side cursor, rows are fetched in batches instead of all at once
+    return stmt.execution_options(yield_per=configs.UPLOAD_CHUNK_ROWS)
+
+async def load_classes(session: AsyncSession) -> dict[ulid.ULID, ExportClass]:
+    # 수업은 학생 수와 상관없이 많지 않으니 메모리에 올린다
+    stmt = (select(Class.class_id, Class.division, Lecture.lecture_id, Lecture.room, Subject.name)
+            .join(Lecture, Class.lecture_id == Lecture.lecture_id)
+            .join(Subject, Lecture.subject_id == Subject.subject_id))
+    classes = {}
+    for class_id, division, lecture_id, room, subject in await session.execute(stmt):
+        classes[class_id] = ExportClass(subject, division, room, lecture_id)
+
+    stmt = select(Period.class_id, Period.day, Period.period).order_by(Period.day, Period.period)
+    for class_id, day, period in await session.execute(stmt):
+        classes[class_id].slots.append((day, period))
+
+    return classes
+
+def student_scope(generations: list[int] = None):
+    # 학번은 한 자리 학년으로 쓰므로 1~9학년만 내보낼 수 있다
+    scope = [UserInfo.role.op('&')(Role.STUDENT) != 0,
+             UserInfo.generation.between(get_generation(9), get_generation(1))]
+    if generations:
+        scope.append(UserInfo.generation.in_(generations))
+
+    return scope
+
+async def iter_students(session: AsyncSession, generations: list[int] = None):
+    stmt = (select(UserInfo.user_info_id, UserInfo.generation, UserInfo.clazz, UserInfo.number, UserInfo.name,
+                   UserInfo.credit, Enrollment.class_id)
+            .join(Enrollment, Enrollment.user_info_id == UserInfo.user_info_id)
+            .where(*student_scope(generations))
+            .order_by(UserInfo.generation.desc(), UserInfo.clazz, UserInfo.number, UserInfo.user_info_id))
+
+    student, class_ids = None, []
+    result = await session.stream(stream_options(stmt))
+    async for user_info_id, generation, clazz, number, name, credit, class_id in result:
+        if student is not None and student[0] != user_info_id:
+            yield student, class_ids
+            class_ids = []
+
+        student = (user_info_id, generation, clazz, number, name, credit)
+        class_ids.append(class_id)
+
+    if student is not None:
+        yield student, class_ids
+
+
+def student_block(student: tuple, classes: list[ExportClass]) -> list[list]:
+    _, generation, clazz, number, name, credit = student
+    grid = [[None] * DAYS for _ in range(PERIODS)]
+
+    unplaced = []
+    for c in classes:
+        placed = False
+        for day, period in c.slots:
+            if 1 <= day <= DAYS and 1 <= period <= PERIODS and grid[period - 1][day - 1] is None:
+                grid[period - 1][day - 1] = c.label
+                placed = True
+        if not placed:
+            unplaced.append(c)
+
+    # 시간이 없거나 겹치는 수업도 수강 정보는 남아야 하므로 빈 칸에 적는다
+    free = [(y, x) for y in range(PERIODS) for x in range(DAYS) if grid[y][x] is None]
+    if len(unplaced) > len(free):
+        logger.warning('too many classes to export', generation=generation, clazz=clazz, number=number, name=name)
+    for c, (y, x) in zip(unplaced, free):
+        grid[y][x] = c.label
+
+    header = [f'{get_grade(generation)}{clazz:02d}{number:02d} {name}', f'{credit or 0} 학점']
+    return [header + [None] * (DAYS - len(header))] + grid
+
+async def append_blocks(sheet: SheetWriter, blocks: list[list[list]]):
+    for y in range(template.height):
+        row = []
+        for block in blocks:
+            row += block[y] + [None]
+        await sheet.append(row)
+    await sheet.append([])
+
+async def write_enrollments(session: AsyncSession, path, generations: list[int] = None) -> int:
+    classes = await load_classes(session)
+
+    sheet = SheetWriter()
+    # write-only 시트는 크기 정보가 없어서 첫 행이 전체 열을 덮어야 한다 (sheet_width)
+    await sheet.append([ENROLLMENT_TITLE] + [''] * (BLOCKS_PER_ROW * (DAYS + 1) - 1))
+
+    students, blocks = 0, []
+    async for student, class_ids in iter_students(session, generations):
+        blocks.append(student_block(student, [classes[class_id] for class_id in class_ids]))
+        students += 1
+        if len(blocks) == BLOCKS_PER_ROW:
+            await append_blocks(sheet, blocks)
+            blocks = []
+
+    if blocks:
+        await append_blocks(sheet, blocks)
+
+    await sheet.save(path)
+    logger.info('enrollments exported', students=students)
+    return students
+
+async def write_lectures(session: AsyncSession, path) -> int:
+    stmt = (select(Subject.name, UserInfo.name, Lecture.room)
+            .join(Lecture, Lecture.subject_id == Subject.subject_id)
+            .join(UserInfo, Lecture.teacher_info_id == UserInfo.user_info_id)
+            .order_by(Subject.name, UserInfo.name, Lecture.room))
+
+    sheet = SheetWriter()
+    await sheet.append(LECTURE_HEADER)
+
+    lectures, row = 0, []
+    result = await session.stream(stream_options(stmt))
+    async for subject, teacher, room in result:
+        # 한 행에 교사/교실 세 쌍까지, 넘치면 같은 과목으로 다음 행에 이어 쓴다
+        if row and (row[0] != subject or len(row) == template_room.width):
+            await sheet.append(row)
+            row = []
+        if not row:
+            row = [subject]
+
+        row += [teacher, room]
+        lectures += 1
+
+    if row:
+        await sheet.append(row)
+
+    await sheet.save(path)
+    logger.info('lectures exported', lectures=lectures)
+    return lectures
+
+async def write_periods(session: AsyncSession, path) -> int:
+    # 모든 과목을 적어두면 업로드 때 수강 신청 파일의 시간 대신 이 파일의 시간을 쓴다 (unify_periods)
+    stmt = (select(Lecture.lecture_id, Subject.name, UserInfo.name, Class.division, Period.day, Period.period)
+            .join(Subject, Lecture.subject_id == Subject.subject_id)
+            .join(UserInfo, Lecture.teacher_info_id == UserInfo.user_info_id)
+            .join(Class, Class.lecture_id == Lecture.lecture_id)
+            .join(Period, Period.class_id == Class.class_id)
+            .order_by(Subject.name, UserInfo.name, Lecture.lecture_id, Class.division, Period.period))
+
+    sheet = SheetWriter()
+    await sheet.append(PERIOD_HEADER)
+
+    async def append_lecture(subject: str, teacher: str, days: list[dict]):
+        cells = []
+        for divisions in days:
+            lines = [f'{",".join(map(str, periods))}({division}분반)' for division, periods in divisions.items()]
+            cells.append('\n'.join(lines) or None)
+        await sheet.append([subject, teacher] + cells)
+
+    periods, lecture, days = 0, None, []
+    result = await session.stream(stream_options(stmt))
+    async for lecture_id, subject, teacher, division, day, period in result:
+        if lecture is None or lecture[0] != lecture_id:
+            if lecture is not None:
+                await append_lecture(*lecture[1:], days)
+            lecture, days = (lecture_id, subject, teacher), [defaultdict(list) for _ in range(DAYS)]
+
+        if not 1 <= day <= DAYS:
+            logger.warning('period out of the week is not exported', subject=subject, day=day, period=period)
+            continue
+
+        days[day - 1][division].append(period)
+        periods += 1
+
+    if lecture is not None:
+        await append_lecture(*lecture[1:], days)
+
+    await sheet.save(path)
+    logger.info('periods exported', periods=periods)
+    return periods
+
+
+async def export_workbooks(session: AsyncSession, directory, generations: list[int] = None) -> tuple[str, str, str]:
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    paths = directory / 'enrollment.xlsx', directory / 'lecture.xlsx', directory / 'period.xlsx'
+    await write_enrollments(session, paths[0], generations)
+    await write_lectures(session, paths[1])
+    await write_periods(session, paths[2])
+
+    return tuple(map(str, paths))
+
+EXPORTS = {
+    'enrollment': write_enrollments,
+    'lecture': write_lectures,
+    'period': write_periods,
+}
+
+
+async def run(args):
+    engine = create_async_engine(args.database_url, pool_pre_ping=True)
+    sessionmaker = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False, autoflush=False)
+    try:
+        async with sessionmaker() as session:
+            paths = await export_workbooks(session, args.directory, args.generations)
+    finally:
+        await engine.dispose()
+
+    print('exported to', *paths)
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m app.upload.export', description='export timetable workbooks')
+    parser.add_argument('directory', help='directory to write enrollment, lecture and period workbooks')
+    parser.add_argument('--database-url', default=configs.DATABASE_URL)
+    parser.add_argument('--generation', type=int, action='append', dest='generations',
+                        help='export only this generation, can be repeated')
+    args = parser.parse_args()
+
+    configure_logger(json=False)
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
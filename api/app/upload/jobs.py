@@ -0,0 +1,359 @@
+import asyncio
+import hashlib
+import shutil
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable
+
+import structlog
+import ulid
+from fastapi import UploadFile
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import configs
+from app.core.database import AsyncSessionLocal, generate_ulid
+from app.timetable.crud import warm_timetables
+from app.upload.cache import cache_key, load_parsed, store_parsed
+from app.upload.conflict import find_conflicts
+from app.upload.context import ImportContext
+from app.upload.exceptions import UploadTooLargeError, UploadError
+from app.timetable.model import Enrollment
+from app.upload.model import UploadHistory
+from app.upload.pool import parse_workbooks
+from app.upload.schema import DiffResult, ScheduleConflict
+from app.upload.staging import Staging
+from app.upload.template import unify_periods
+from app.upload.upload import upload_teachers, upload_students, upload_lectures, upload_periods, upload_enrollments, \
+    affected_students, bump_timetable_versions, backfill_color_schemes
+from app.util.common import hash_files, combine_hashes
+
+logger = structlog.get_logger()
+
+class JobStage:
+
+    QUEUED = 'queued'
+    PARSE = 'parse'
+    TEACHERS = 'teachers'
+    STUDENTS = 'students'
+    LECTURES = 'lectures'
+    PERIODS = 'periods'
+    ENROLLMENTS = 'enrollments'
+    VERSIONS = 'versions'
+    THEMES = 'themes'
+    SWAP = 'swap'
+    WARMUP = 'warmup'
+    DONE = 'done'
+    FAILED = 'failed'
+
+
+@dataclass
+class StageProgress:
+    stage: str
+    rows: int = 0
+    added: int | None = None
+    removed: int | None = None
+    kept: int | None = None
+    selects: int = 0
+    started_at: float = field(default_factory=time.perf_counter)
+    finished_at: float | None = None
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.perf_counter()) - self.started_at
+
+    @property
+    def throughput(self) -> float:
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+
+@dataclass
+class UploadJob:
+    job_id: ulid.ULID = field(default_factory=generate_ulid)
+    stage: str = JobStage.QUEUED
+    created_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    stages: list[StageProgress] = field(default_factory=list)
+    errors: list[str] = field(default_factory=list)
+    conflicts: list[ScheduleConflict] = field(default_factory=list)
+    skipped: bool = False
+
+    @property
+    def rows(self) -> int:
+        return sum(s.rows for s in self.stages)
+
+    @property
+    def elapsed(self) -> float:
+        return sum(s.elapsed for s in self.stages)
+
+    @property
+    def throughput(self) -> float:
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def finished(self) -> bool:
+        return self.stage in (JobStage.DONE, JobStage.FAILED)
+
+    def begin(self, stage: str):
+        self._close_stage()
+        self.stage = stage
+        self.stages.append(StageProgress(stage))
+        logger.info('upload stage started', job_id=str(self.job_id), stage=stage)
+
+    def advance(self, rows: int, diff: DiffResult | None = None):
+        if not self.stages:
+            return
+
+        current = self.stages[-1]
+        current.rows += rows
+        if diff is not None:
+            current.added, current.removed, current.kept = diff.added, diff.removed, diff.kept
+
+    def count_select(self):
+        if self.stages:
+            self.stages[-1].selects += 1
+
+    def skip(self):
+        self.skipped = True
+        logger.info('upload skipped, workbooks are unchanged', job_id=str(self.job_id))
+
+    def finish(self):
+        self._close_stage()
+        self.stage = JobStage.DONE
+        logger.info('upload finished', job_id=str(self.job_id), rows=self.rows, elapsed=self.elapsed)
+
+    def fail(self, error: Exception):
+        self._close_stage()
+        self.stage = JobStage.FAILED
+        self.errors.append(str(error))
+        logger.error('upload failed', job_id=str(self.job_id), exc_info=error)
+
+    def _close_stage(self):
+        if self.stages and self.stages[-1].finished_at is None:
+            current = self.stages[-1]
+            current.finished_at = time.perf_counter()
+            logger.info('upload stage finished', job_id=str(self.job_id), stage=current.stage,
+                        rows=current.rows, selects=current.selects, elapsed=current.elapsed,
+                        throughput=current.throughput)
+
+
+async def import_workbooks(
+        job: UploadJob,
+        enrollment_path: str,
+        lecture_path: str,
+        period_path: str,
+        session: AsyncSession,
+        diff: bool = False,
+        content_hash: str = None,
+        generations: Iterable[int] = None,
+        swap: bool = False,
+        touch_all: bool = False
+) -> set[ulid.ULID]:
+    job.begin(JobStage.PARSE)
+    # 파일 전체를 읽는 해시와 캐시의 pickle은 thread에서, 루프에서 돌면 그동안 다른 요청이 멈춘다
+    content_hash = content_hash or await asyncio.to_thread(hash_files, enrollment_path, lecture_path, period_path)
+    generations = frozenset(generations) if generations else None
+
+    upload_hash = content_hash
+    if generations is not None: # 같은 파일이라도 학년 범위가 다르면 다른 업로드
+        upload_hash = combine_hashes(bytes.fromhex(content_hash), ','.join(map(str, sorted(generations))).encode())
+
+    if diff and not swap and not touch_all:
+        # diff가 아닌 업로드는 지우지 않으므로, 마지막 업로드가 같은 파일이어도 diff였을 때만 테이블이 워크북과 같다
+        # swap은 테이블을 다시 만들고 touch_all은 모든 학생의 버전을 올리라는 것이므로 같은 파일이어도 건너뛰지 않는다
+        stmt = (select(UploadHistory.content_hash, UploadHistory.diff)
+                .order_by(UploadHistory.created_at.desc(), UploadHistory.upload_id.desc()).limit(1))
+        if (await session.execute(stmt)).first() == (upload_hash, True):
+            job.skip()
+            return set()
+
+    key = cache_key(content_hash)
+    parsed = await asyncio.to_thread(load_parsed, key)
+    if parsed is None:
+        enrollments, periods, lectures, multi_tch_periods = await parse_workbooks(
+            enrollment_path, lecture_path, period_path
+        )
+        periods = unify_periods(periods, multi_tch_periods, lectures)
+        parsed = (enrollments, periods, lectures)
+        await asyncio.to_thread(store_parsed, key, parsed)
+
+    enrollments, periods, lectures = parsed
+    job.advance(len(enrollments) + len(lectures) + len(periods))
+
+    if generations is not None:
+        enrollments = [e for e in enrollments if e.generation in generations]
+        logger.info('upload scoped', job_id=str(job.job_id), generations=sorted(generations), students=len(enrollments))
+
+    # 쓰기 전에 학생별 시간표 충돌 확인
+    job.conflicts = find_conflicts(enrollments, periods)
+    if job.conflicts:
+        logger.warning('schedule conflicts found', job_id=str(job.job_id), conflicts=len(job.conflicts),
+                       first=str(job.conflicts[0]))
+        if configs.UPLOAD_REJECT_CONFLICTS:
+            raise UploadError('schedule conflicts found', conflicts=len(job.conflicts))
+
+    # staging 테이블에 쓰면 GET /timetable이 읽는 테이블은 마지막 swap 때까지 그대로다
+    staging = await Staging.create(session) if swap else None
+
+    context = ImportContext(session, generations=generations, touch_all=touch_all)
+    stop_counting = context.count_selects(job.count_select)
+
+    # 모든 stage를 하나의 transaction으로, 중간에 실패하면 아무것도 남기지 않는다
+    # MariaDB에서 swap하면 경계가 달라진다: staging 테이블은 이 transaction 전에 만들어 커밋되었고,
+    # RENAME TABLE이 암묵적으로 커밋하므로 transaction은 swap에서 끝나고 기록은 그 뒤에 따로 커밋된다
+    try:
+        job.begin(JobStage.TEACHERS)
+        await context.load()
+        await upload_teachers(lectures, context)
+        job.advance(len(lectures))
+
+        job.begin(JobStage.STUDENTS)
+        await upload_students(enrollments, context)
+        job.advance(len(enrollments))
+
+        job.begin(JobStage.LECTURES)
+        await upload_lectures(lectures, context)
+        job.advance(len(lectures))
+
+        job.begin(JobStage.PERIODS)
+        subjects = {s for e in enrollments for s in e.subjects} if generations is not None else None
+        result = await upload_periods(periods, context, diff=diff, staging=staging, subjects=subjects)
+        job.advance(len(periods), result)
+
+        job.begin(JobStage.ENROLLMENTS)
+        result = await upload_enrollments(enrollments, context, diff=diff, staging=staging)
+        job.advance(len(enrollments), result)
+
+        # 버전과 테마를 swap 전에, staging 테이블을 읽어서 처리하고 RENAME을 마지막 문장으로 둔다
+        # 그래야 PostgreSQL에서 RENAME의 잠금이 커밋까지 잠깐만 잡히고, MariaDB에서는 RENAME의 암묵적 커밋에 같이 들어간다
+        enrollment_table = Enrollment.__table__
+        if staging is not None:
+            await staging.validate(session)
+            enrollment_table = staging.tables[Enrollment.__tablename__]
+
+        job.begin(JobStage.VERSIONS)
+        students = await affected_students(context, enrollment_table)
+        job.advance(await bump_timetable_versions(context, students))
+
+        job.begin(JobStage.THEMES)
+        job.advance(await backfill_color_schemes(context, students, enrollment_table))
+
+        # 기록도 RENAME 전에 쓴다, MariaDB에서는 RENAME이 실패하면 다시 올릴 수 있게 swap이 끝난 뒤에 남긴다
+        if staging is None or staging.transactional:
+            session.add(UploadHistory(content_hash=upload_hash, diff=diff))
+            await session.flush()
+
+        if staging is not None:
+            job.begin(JobStage.SWAP)
+            await staging.swap(session)
+            job.advance(sum(staging.expected.values()))
+            if not staging.transactional:
+                session.add(UploadHistory(content_hash=upload_hash, diff=diff))
+
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        if staging is not None:
+            await staging.drop(session)
+        raise
+    finally:
+        stop_counting()
+
+    if staging is not None:
+        try:
+            await staging.drop(session)
+        except Exception as e: # 업로드는 이미 커밋되었다
+            logger.warning('old tables were not dropped', job_id=str(job.job_id), error=str(e))
+
+    logger.info('upload committed', job_id=str(job.job_id), selects=context.selects)
+    return students
+
+
+## ===== Job Registry =====
+MAX_JOBS = 100
+READ_CHUNK = 1024 * 1024
+
+jobs: dict[ulid.ULID, UploadJob] = {}
+tasks: set[asyncio.Task] = set()
+
+# 업로드는 한 번에 하나씩, 기다리는 job은 QUEUED로 남고 들어온 순서대로 돈다
+# 같은 프로세스 안에서만 막으므로 worker가 여럿이거나 CLI로 같이 올리면 막지 못한다
+upload_lock = asyncio.Lock()
+
+@dataclass(frozen=True)
+class SavedUpload:
+    path: str
+    size: int
+    digest: bytes # sha256
+
+# 청크 단위로 디스크에 옮기면서 크기 제한과 해시를 같이 처리, 파일 전체를 메모리에 올리지 않는다
+async def save_upload(upload: UploadFile, path: Path, max_bytes: int = None) -> SavedUpload:
+    max_bytes = max_bytes or configs.UPLOAD_MAX_BYTES
+    hasher = hashlib.sha256()
+    size = 0
+    with open(path, 'wb') as f:
+        while chunk := await upload.read(READ_CHUNK):
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLargeError(f'{upload.filename} is larger than {max_bytes} bytes',
+                                          payload={'filename': upload.filename, 'max_bytes': max_bytes})
+
+            hasher.update(chunk)
+            f.write(chunk)
+
+    return SavedUpload(str(path), size, hasher.digest())
+
+async def run_upload_job(
+        job: UploadJob,
+        directory: Path,
+        uploads: tuple[SavedUpload, ...],
+        diff: bool,
+        generations: Iterable[int] = None,
+        swap: bool = False,
+        touch_all: bool = False
+):
+    paths = [upload.path for upload in uploads]
+    content_hash = combine_hashes(*(upload.digest for upload in uploads))
+    if upload_lock.locked():
+        logger.info('upload job queued', job_id=str(job.job_id))
+
+    async with upload_lock:
+        try:
+            async with AsyncSessionLocal() as session:
+                students = await import_workbooks(job, *paths, session, diff=diff, content_hash=content_hash,
+                                                  generations=generations, swap=swap, touch_all=touch_all)
+
+            # 커밋한 뒤에 채우므로 실패해도 업로드는 남고, 캐시는 요청이 들어올 때 채워진다
+            if students:
+                job.begin(JobStage.WARMUP)
+                try:
+                    await warm_timetables(students, job.advance)
+                except Exception as e:
+                    logger.warning('timetable warmup failed', job_id=str(job.job_id), error=str(e))
+            job.finish()
+        except Exception as e:
+            job.fail(e)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+def submit_upload_job(
+        directory: Path,
+        uploads: tuple[SavedUpload, ...],
+        diff: bool = False,
+        generations: Iterable[int] = None,
+        swap: bool = False,
+        touch_all: bool = False
+) -> UploadJob:
+    finished = [job_id for job_id, job in jobs.items() if job.finished]
+    for job_id in finished[:max(len(jobs) - MAX_JOBS + 1, 0)]:
+        del jobs[job_id]
+
+    job = UploadJob()
+    jobs[job.job_id] = job
+
+    task = asyncio.create_task(run_upload_job(job, directory, uploads, diff, generations, swap, touch_all))
+    tasks.add(task)
+    task.add_done_callback(tasks.discard)
+
+    return job
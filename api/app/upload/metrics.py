@@ -0,0 +1,47 @@
+import json
+import resource
+import sys
+from dataclasses import dataclass, asdict
+from pathlib import Path
+
+# benchmark와 python -m app.upload가 같이 쓰는 측정 결과와 출력
+@dataclass
+class Measurement:
+    name: str
+    rows: int
+    elapsed: float
+    peak_bytes: int | None = None
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def to_dict(self) -> dict:
+        return asdict(self) | {'rows_per_second': self.rows_per_second}
+
+
+def peak_rss_bytes() -> int:
+    # ru_maxrss survives exec, a spawned process would report the peak of its parent, VmHWM is per address space
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    scale = 1 if sys.platform == 'darwin' else 1024 # ru_maxrss is in bytes on macOS, KiB elsewhere
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+def report(results: list[Measurement], baseline: Path = None):
+    before = {}
+    if baseline is not None:
+        before = {r['name']: r for r in json.loads(baseline.read_text())['results']}
+
+    print(f'{"name":<32} {"rows":>8} {"elapsed":>10} {"rows/s":>12} {"peak MiB":>9} {"vs base":>8}')
+    for r in results:
+        peak = f'{r.peak_bytes / 2 ** 20:.1f}' if r.peak_bytes is not None else '-'
+        ratio = '-'
+        if r.name in before and before[r.name]['elapsed']:
+            ratio = f'{before[r.name]["elapsed"] / r.elapsed:.2f}x' if r.elapsed else '-'
+        print(f'{r.name:<32} {r.rows:>8} {r.elapsed:>9.3f}s {r.rows_per_second:>12.1f} {peak:>9} {ratio:>8}')
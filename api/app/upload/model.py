@@ -0,0 +1,18 @@
+from datetime import datetime
+
+import ulid
+from sqlalchemy import String, DateTime, Boolean, func, false
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.core.database import Base, ULID, generate_ulid
+
+
+class UploadHistory(Base):
+    __tablename__ = 'upload_histories'
+
+    upload_id: Mapped[ulid.ULID] = mapped_column(ULID(), primary_key=True, default=generate_ulid)
+    content_hash: Mapped[str] = mapped_column(String(64), nullable=False, index=True)
+    # diff 업로드만 범위 안의 테이블을 워크북과 같게 남긴다, 같은 워크북을 다시 올려도 건너뛰는 것은 이때뿐이다
+    diff: Mapped[bool] = mapped_column(Boolean, nullable=False, server_default=false())
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
@@ -0,0 +1,58 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+
+from app.core.config import configs
+from app.upload.schema import EnrollmentInfo, PeriodInfo, LectureInfo
+from app.upload.template import count_sheets, parse_enrollments, parse_lectures, parse_periods
+
+executor: ProcessPoolExecutor | None = None
+
+def get_executor() -> ProcessPoolExecutor:
+    global executor
+    if executor is None:
+        # spawn, forking a process that runs an event loop and logging threads is not safe
+        executor = ProcessPoolExecutor(
+            max_workers=configs.UPLOAD_PARSE_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+
+    return executor
+
+def shutdown_executor():
+    global executor
+    if executor is not None:
+        executor.shutdown(cancel_futures=True)
+        executor = None
+
+
+async def run_in_pool(fn, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), fn, *args)
+
+async def parse_sheets(fn, path: str) -> list:
+    sheets = await run_in_pool(count_sheets, path)
+    return await asyncio.gather(*(run_in_pool(fn, path, sheet) for sheet in range(sheets)))
+
+def merge_unique(lists) -> list:
+    return list(dict.fromkeys(chain.from_iterable(lists)))
+
+
+async def parse_workbooks(
+        enrollment_path: str,
+        lecture_path: str,
+        period_path: str
+) -> tuple[list[EnrollmentInfo], list[PeriodInfo], list[LectureInfo], list[PeriodInfo]]:
+    enrollment_sheets, lecture_sheets, period_sheets = await asyncio.gather(
+        parse_sheets(parse_enrollments, enrollment_path),
+        parse_sheets(parse_lectures, lecture_path),
+        parse_sheets(parse_periods, period_path),
+    )
+
+    enrollments = list(chain.from_iterable(e for e, _ in enrollment_sheets))
+    periods = merge_unique(p for _, p in enrollment_sheets)
+    lectures = merge_unique(lecture_sheets)
+    multi_tch_periods = list(chain.from_iterable(period_sheets))
+
+    return enrollments, periods, lectures, multi_tch_periods
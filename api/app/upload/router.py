@@ -1,20 +1,32 @@
+import shutil
+import tempfile
 from typing import List
 
-from fastapi import APIRouter
-from fastapi.params import Depends
-from starlette.responses import JSONResponse
+from fastapi import APIRouter, UploadFile, File, Form, status
+from fastapi.params import Depends, Path as PathParam
+from starlette.background import BackgroundTask
+from starlette.responses import JSONResponse, FileResponse
 
-from app.auth.exceptions import AuthorizationError
+from app.auth.exceptions import AuthorizationError, NoPermissionError
+from app.auth.model import User
 from app.auth.schemas import IdentifyTokenSchema
 from app.core.config import configs
 from pathlib import Path
 
 from app.core.database import conn
+from app.core.dependencies import get_current_user
 from app.core.response import create_response, BaseResponse
+from app.core.types import ULIDModel
+from app.upload.exceptions import UnknownUploadJobError, UnknownExportError
+from app.upload.export import EXPORTS
+from app.upload.jobs import UploadJob, import_workbooks, jobs, save_upload, submit_upload_job, upload_lock
+from app.upload.schema import UploadJobSchema
 from app.upload.upload import *
 
 router = APIRouter(prefix="/upload", tags=["Upload"])
 
+UPLOAD_FORM_OVERHEAD = 1024 * 1024 # multipart 경계와 form 필드, POST /upload/jobs 본문 제한에 더한다
+
 @router.get("/", response_model=List[UserInfoData])
 async def healthy():
     return JSONResponse('healthy: ' + datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
@@ -33,16 +45,8 @@ async def initialize(
     lecture_path = resources / 'lecture.xlsx'
     period_path = resources / 'period.xlsx'
 
-    enrollments, periods = parse_enrollments(str(enrollments_path))
-    lectures = parse_lectures(str(lecture_path))
-    multi_tch_periods = parse_periods(str(period_path))
-    periods = unify_periods(periods, multi_tch_periods, lectures)
-
-    await upload_teachers(lectures, session)
-    await upload_students(enrollments, session)
-    await upload_lectures(lectures, session)
-    await upload_periods(periods, session)
-    await upload_enrollments(enrollments, session)
+    async with upload_lock:
+        await import_workbooks(UploadJob(), str(enrollments_path), str(lecture_path), str(period_path), session)
 
     stmt = select(UserInfo).where(UserInfo.name == 'admin')
     result = await session.execute(stmt)
@@ -51,4 +55,75 @@ async def initialize(
 
     await session.commit()
 
-    return create_response(await query_token_for('admin', session))
\ No newline at end of file
+    return create_response(await query_token_for('admin', session))
+
+
+@router.post('/jobs', response_model=BaseResponse[UploadJobSchema], status_code=status.HTTP_202_ACCEPTED)
+async def create_upload_job(
+        enrollment: UploadFile = File(description='enrollment workbook'),
+        lecture: UploadFile = File(description='lecture workbook'),
+        period: UploadFile = File(description='period workbook'),
+        diff: bool = Form(default=False, description='write only changed enrollments and periods'),
+        generations: List[int] = Form(default=[], description='upload only these generations, every one if empty'),
+        swap: bool = Form(default=False, description='load into staging tables and swap them in at the end'),
+        touch_all: bool = Form(default=False, description='treat every uploaded row as changed, bumping every student'),
+        user: User = Depends(get_current_user),
+):
+    if user.user_info.role < Role.MANAGER:
+        raise NoPermissionError('No permission')
+
+    directory = Path(tempfile.mkdtemp(prefix='upload-'))
+    try:
+        uploads = (
+            await save_upload(enrollment, directory / 'enrollment.xlsx'),
+            await save_upload(lecture, directory / 'lecture.xlsx'),
+            await save_upload(period, directory / 'period.xlsx'),
+        )
+    except Exception:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+
+    job = submit_upload_job(directory, uploads, diff, generations, swap, touch_all)
+
+    return create_response(UploadJobSchema.model_validate(job), user.user_id, status_code=status.HTTP_202_ACCEPTED)
+
+@router.get('/jobs/{job_id}', response_model=BaseResponse[UploadJobSchema])
+async def get_upload_job(
+        job_id: ULIDModel = PathParam(description='upload job id you want to query'),
+        user: User = Depends(get_current_user),
+):
+    if user.user_info.role < Role.MANAGER:
+        raise NoPermissionError('No permission')
+
+    job = jobs.get(job_id)
+    if job is None:
+        raise UnknownUploadJobError('Cannot find upload job ' + str(job_id))
+
+    return create_response(UploadJobSchema.model_validate(job), user.user_id)
+
+XLSX_MEDIA_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+@router.get('/export/{kind}')
+async def export_workbook(
+        kind: str = PathParam(description='enrollment, lecture or period'),
+        session: AsyncSession = Depends(conn),
+        user: User = Depends(get_current_user),
+):
+    if user.user_info.role < Role.MANAGER:
+        raise NoPermissionError('No permission')
+
+    write = EXPORTS.get(kind)
+    if write is None:
+        raise UnknownExportError('Cannot export ' + kind)
+
+    # write-only 워크북은 행을 임시 파일로 흘려 쓰고, 응답은 파일을 조각내서 보낸다
+    directory = Path(tempfile.mkdtemp(prefix='export-'))
+    path = directory / f'{kind}.xlsx'
+    try:
+        await write(session, path)
+    except Exception:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+
+    return FileResponse(path, media_type=XLSX_MEDIA_TYPE, filename=path.name,
+                        background=BackgroundTask(shutil.rmtree, directory, ignore_errors=True))
@@ -1,7 +1,12 @@
 from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Any
 
+from pydantic import BaseModel, ConfigDict, field_validator
+from ulid import ULID
 
-@dataclass
+
+@dataclass(frozen=True, slots=True)
 class LectureInfo:
     subject: str
     teacher: str
@@ -14,7 +19,7 @@ class LectureInfo:
         return self.__repr__()
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class PeriodInfo:
     subject: str
     teacher: str
@@ -28,14 +33,14 @@ class PeriodInfo:
     def __str__(self) -> str:
         return self.__repr__()
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class EnrollmentInfo:
     generation: int
     clazz: int
     number: int
     name: str
     credit: int
-    subjects: list[tuple[str, int]]  # (subject, division)
+    subjects: tuple[tuple[str, int], ...]  # (subject, division)
 
     def __repr__(self) -> str:
         return (f'[generation: {self.generation}, clazz: {self.clazz}, number: {self.number},'
@@ -44,3 +49,77 @@ class EnrollmentInfo:
     def __str__(self) -> str:
         return self.__repr__()
 
+
+@dataclass(frozen=True, slots=True)
+class ScheduleConflict:
+    generation: int
+    clazz: int
+    number: int
+    name: str
+    slots: tuple[tuple[int, int], ...] # (day, period)
+    subjects: tuple[tuple[str, int], ...] # (subject, division) taking the slots
+
+    def __repr__(self) -> str:
+        return (f'[generation: {self.generation}, clazz: {self.clazz}, number: {self.number},'
+                f' name: {self.name}, slots: {self.slots}, subjects: {self.subjects}]')
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+
+@dataclass
+class DiffResult:
+    added: int = 0
+    removed: int = 0
+    kept: int = 0
+
+    def __repr__(self) -> str:
+        return f'[added={self.added}, removed={self.removed}, kept={self.kept}]'
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+
+class StageProgressSchema(BaseModel):
+    stage: str
+    rows: int
+    elapsed: float
+    throughput: float
+    added: int | None
+    removed: int | None
+    kept: int | None
+    selects: int
+
+    model_config = ConfigDict(from_attributes=True)
+
+class ScheduleConflictSchema(BaseModel):
+    generation: int
+    clazz: int
+    number: int
+    name: str
+    slots: List[tuple[int, int]]
+    subjects: List[tuple[str, int]]
+
+    model_config = ConfigDict(from_attributes=True)
+
+class UploadJobSchema(BaseModel):
+    job_id: str
+    stage: str
+    created_at: datetime
+    skipped: bool
+    rows: int
+    elapsed: float
+    throughput: float
+    stages: List[StageProgressSchema]
+    conflicts: List[ScheduleConflictSchema]
+    errors: List[str]
+
+    model_config = ConfigDict(from_attributes=True)
+
+    @field_validator('job_id', mode='before')
+    @classmethod
+    def serialize_ulid(cls, v: Any):
+        if isinstance(v, ULID):
+            return str(v)
+
+        return v
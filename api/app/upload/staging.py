@@ -0,0 +1,148 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Callable
+
+import structlog
+from sqlalchemy import MetaData, Table, select, insert, func, exists, not_, text, ColumnElement
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.auth.model import UserInfo
+from app.core.database import generate_ulid
+from app.timetable.model import Class, Enrollment, Period
+from app.upload.bulk import apply_diff
+from app.upload.exceptions import UploadError
+from app.upload.schema import DiffResult
+
+logger = structlog.get_logger()
+
+# GET /timetable이 읽는 테이블, 업로드 중에는 staging 테이블에 쓰고 마지막에 이름만 바꾼다
+# 읽기가 막히지 않는 것은 아니다, RENAME부터 커밋까지는 live 테이블이 잠겨 그 사이의 읽기는 기다린다
+SWAP_MODELS = (Period, Enrollment)
+REFERENCED_MODELS = (Class, UserInfo) # foreign key가 가리키는 테이블, 만들지는 않는다
+
+# PostgreSQL에서 swap 전에 live 테이블을 잠글 때, 기다리는 동안 새 읽기도 뒤에 줄을 서므로 짧게 기다리고 다시 시도한다
+SWAP_LOCK_TIMEOUT_MS = 50
+SWAP_LOCK_ATTEMPTS = 100
+LOCK_NOT_AVAILABLE = '55P03'
+
+def transactional_ddl(dialect: str) -> bool:
+    # MariaDB는 DDL마다 암묵적으로 커밋한다, PostgreSQL과 SQLite는 DDL도 transaction 안에서 되돌릴 수 있다
+    return dialect not in ('mysql', 'mariadb')
+
+@dataclass
+class Staging:
+    suffix: str
+    tables: dict[str, Table] # live table name -> staging table
+    transactional: bool # 만들기부터 swap까지 업로드 transaction 하나에 들어가는지
+    expected: dict[str, int] = field(default_factory=dict)
+
+    @classmethod
+    async def create(cls, session: AsyncSession) -> 'Staging':
+        suffix = generate_ulid().str.lower()
+        metadata = MetaData()
+        for model in REFERENCED_MODELS:
+            model.__table__.to_metadata(metadata)
+
+        tables = {m.__tablename__: m.__table__.to_metadata(metadata, name=f'{m.__tablename__}_staging_{suffix}')
+                  for m in SWAP_MODELS}
+
+        # MariaDB에서는 업로드 transaction을 시작하기 전에 만들고 커밋한다, 나머지는 실패하면 같이 되돌려진다
+        transactional = transactional_ddl(session.get_bind().dialect.name)
+        connection = await session.connection()
+        await connection.run_sync(metadata.create_all, tables=list(tables.values()))
+        if not transactional:
+            await session.commit()
+
+        logger.info('staging tables created', tables=[t.name for t in tables.values()])
+        return cls(suffix, tables, transactional)
+
+    async def apply(
+            self,
+            session: AsyncSession,
+            model,
+            columns: tuple[str, ...],
+            targets,
+            scope: ColumnElement[bool] = None,
+            remove: bool = True,
+            on_changed: Callable[[list[tuple]], None] = None
+    ) -> DiffResult:
+        table = self.tables[model.__tablename__]
+
+        copied = 0
+        if scope is not None: # 범위 밖의 행은 지금 것 그대로 옮긴다
+            live = select(*(getattr(model, c) for c in columns)).where(not_(scope))
+            copied = (await session.execute(insert(table).from_select(columns, live))).rowcount
+
+        result = await apply_diff(session, model, columns, targets, copy=True, scope=scope, into=table,
+                                  remove=remove, on_changed=on_changed)
+        self.expected[model.__tablename__] = copied + result.added + result.kept
+        return result
+
+    async def validate(self, session: AsyncSession):
+        for name, table in self.tables.items():
+            rows = (await session.execute(select(func.count()).select_from(table))).scalar()
+            if rows != self.expected.get(name, 0):
+                raise UploadError('staging row count mismatch', table=name, rows=rows,
+                                  expected=self.expected.get(name, 0))
+
+            for fk in table.foreign_keys:
+                target = fk.column
+                orphan = ~exists().where(target == fk.parent)
+                orphans = (await session.execute(select(func.count()).select_from(table).where(orphan))).scalar()
+                if orphans:
+                    raise UploadError('staging rows reference missing rows', table=name,
+                                      column=fk.parent.name, references=str(target), orphans=orphans)
+
+        logger.info('staging tables validated', rows=self.expected)
+
+    async def swap(self, session: AsyncSession):
+        # 커밋하지 않는다, PostgreSQL과 SQLite에서는 호출한 쪽의 마지막 커밋 때 다른 쓰기와 함께 보인다
+        # 예전 테이블은 커밋한 뒤 drop에서 지운다, 그래야 live 테이블 잠금을 잡은 채로 할 일이 RENAME뿐이다
+        renames = []
+        for name, table in self.tables.items():
+            renames += [(name, f'{name}_old_{self.suffix}'), (table.name, name)]
+
+        if session.get_bind().dialect.name == 'postgresql':
+            await self.lock(session)
+
+        if not self.transactional:
+            # 여러 테이블을 한 문장으로 바꾸면 읽는 쪽은 바뀌기 전과 후만 본다, 이 문장에서 커밋된다
+            pairs = ', '.join(f'{old} TO {new}' for old, new in renames)
+            await session.execute(text(f'RENAME TABLE {pairs}'))
+        else:
+            for old, new in renames:
+                await session.execute(text(f'ALTER TABLE {old} RENAME TO {new}'))
+
+        logger.info('staging tables swapped', tables=list(self.tables))
+
+    async def lock(self, session: AsyncSession):
+        # RENAME은 테이블마다 잠금을 잡는다, 읽는 쪽이 다른 순서로 잡고 있으면 deadlock이 나고 읽는 쪽이 실패한다
+        # 모든 live 테이블을 한 번에 잠그되, 못 잡으면 놓고 다시 시도해서 읽는 쪽이 먼저 끝나게 한다
+        names = ', '.join(sorted(self.tables))
+        await session.execute(text(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT_MS}ms'"))
+        for attempt in range(1, SWAP_LOCK_ATTEMPTS + 1):
+            try:
+                async with session.begin_nested():
+                    await session.execute(text(f'LOCK TABLE {names} IN ACCESS EXCLUSIVE MODE'))
+                break
+            except DBAPIError as e:
+                if getattr(e.orig, 'sqlstate', None) != LOCK_NOT_AVAILABLE:
+                    raise
+                if attempt == SWAP_LOCK_ATTEMPTS:
+                    raise UploadError('live tables could not be locked for the swap', tables=names,
+                                      attempts=attempt) from e
+                await asyncio.sleep(SWAP_LOCK_TIMEOUT_MS / 1000)
+
+        await session.execute(text('SET LOCAL lock_timeout = DEFAULT'))
+        logger.info('live tables locked', tables=names, attempts=attempt)
+
+    async def drop(self, session: AsyncSession):
+        # swap했으면 예전 테이블이, 실패했으면 남은 staging 테이블이 있다, 없는 쪽은 IF EXISTS로 넘어간다
+        # SQLite 드라이버는 DML 전의 DDL을 바로 커밋하므로 rollback한 뒤에도 staging 테이블이 남아 있을 수 있다
+        names = [t.name for t in self.tables.values()] + [f'{name}_old_{self.suffix}' for name in self.tables]
+        for name in names:
+            await session.execute(text(f'DROP TABLE IF EXISTS {name}'))
+        await session.commit()
+
+        logger.info('staging tables dropped', tables=names)
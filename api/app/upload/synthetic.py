@@ -0,0 +1,135 @@
+import random
+from dataclasses import dataclass
+from pathlib import Path
+
+from openpyxl import Workbook
+
+# 실제 학교 파일과 같은 배치의 벤치마크용 엑셀 생성기
+DAYS = 5
+PERIODS = 8
+LANE_SLOTS = 3 # 한 과목이 일주일에 차지하는 시간
+LANES = DAYS * PERIODS // LANE_SLOTS
+
+BLOCK_COLUMNS = 5
+BLOCKS_PER_ROW = 4
+
+MAX_CLASSES = 99
+STUDENTS_PER_CLASS = 30
+MAX_TEACHERS = 3 # template_room has three teacher/room pairs
+
+@dataclass(frozen=True)
+class SyntheticSpec:
+    students: int = 300
+    subjects: int = 20
+    divisions: int = 3
+    multi_teacher: int = 2 # subjects taught by several teachers, listed in period.xlsx
+    seed: int = 0
+
+    def __post_init__(self):
+        if self.students > 3 * MAX_CLASSES * STUDENTS_PER_CLASS:
+            raise ValueError(f'too many students: {self.students}')
+        if self.multi_teacher > self.subjects:
+            raise ValueError('multi_teacher must not exceed subjects')
+
+
+def subject_name(s: int) -> str:
+    return f'과목{s:03d}'
+
+def room_name(s: int, t: int) -> str:
+    return f'{s + 1}{t:02d}'
+
+def teacher_names(spec: SyntheticSpec, s: int) -> list[str]:
+    count = min(spec.divisions, MAX_TEACHERS) if s < spec.multi_teacher else 1
+    return [f'교사{s:03d}-{t}' for t in range(count)]
+
+def teacher_of(spec: SyntheticSpec, s: int, division: int) -> int:
+    # 여러 교사가 가르치는 과목은 분반을 나눠 맡는다
+    return (division - 1) * len(teacher_names(spec, s)) // spec.divisions
+
+def slots_of(s: int) -> list[tuple[int, int]]:
+    # 같은 lane의 과목은 같은 시간에 열리므로 학생은 lane마다 하나만 듣는다
+    lane = s % LANES
+    slots = (divmod(lane * LANE_SLOTS + k, PERIODS) for k in range(LANE_SLOTS))
+    return [(day, period + 1) for day, period in slots] # (day, period), 교시는 1부터
+
+def student_id(n: int) -> tuple[int, int, int]:
+    grade, rest = n % 3 + 1, n // 3
+    return grade, rest // STUDENTS_PER_CLASS + 1, rest % STUDENTS_PER_CLASS + 1
+
+
+def student_block(spec: SyntheticSpec, n: int, rnd: random.Random) -> list[list]:
+    grade, clazz, number = student_id(n)
+    lanes = {}
+    for s in range(spec.subjects):
+        lanes.setdefault(s % LANES, []).append(s)
+
+    grid = [[None] * BLOCK_COLUMNS for _ in range(PERIODS)]
+    for subjects in lanes.values():
+        s = rnd.choice(subjects)
+        division = rnd.randint(1, spec.divisions)
+        room = room_name(s, teacher_of(spec, s, division))
+        for day, period in slots_of(s):
+            grid[period - 1][day] = f'{subject_name(s)} {division}반 {room}'
+
+    header = [f'{grade}{clazz:02d}{number:02d} 학생{n}', f'{rnd.randint(20, 30)} 학점'] + [None] * (BLOCK_COLUMNS - 2)
+    return [header] + grid
+
+def write_enrollments(spec: SyntheticSpec, path: Path):
+    rnd = random.Random(spec.seed)
+    workbook = Workbook()
+    worksheet = workbook.active
+    worksheet.append(['수강 신청 현황'])
+
+    blocks = [student_block(spec, n, rnd) for n in range(spec.students)]
+    for start in range(0, len(blocks), BLOCKS_PER_ROW):
+        group = blocks[start:start + BLOCKS_PER_ROW]
+        for y in range(PERIODS + 1):
+            row = []
+            for block in group:
+                row += block[y] + [None]
+            worksheet.append(row)
+        worksheet.append([])
+
+    workbook.save(path)
+
+def write_lectures(spec: SyntheticSpec, path: Path):
+    workbook = Workbook()
+    worksheet = workbook.active
+    worksheet.append(['과목', '교사', '교실', '교사', '교실', '교사', '교실'])
+
+    for s in range(spec.subjects):
+        row = [subject_name(s)]
+        for t, teacher in enumerate(teacher_names(spec, s)):
+            row += [teacher, room_name(s, t)]
+        worksheet.append(row + [None] * (1 + 2 * MAX_TEACHERS - len(row)))
+
+    workbook.save(path)
+
+def write_periods(spec: SyntheticSpec, path: Path):
+    workbook = Workbook()
+    worksheet = workbook.active
+    worksheet.append(['과목', '교사', '월', '화', '수', '목', '금'])
+
+    for s in range(spec.multi_teacher):
+        for t, teacher in enumerate(teacher_names(spec, s)):
+            days = [[] for _ in range(DAYS)]
+            divisions = [d for d in range(1, spec.divisions + 1) if teacher_of(spec, s, d) == t]
+            for day, period in slots_of(s):
+                days[day] += [f'{period}({d}분반)' for d in divisions]
+
+            subject = subject_name(s) if t == 0 else None # 이어지는 행은 과목을 비워둔다
+            worksheet.append([subject, teacher] + ['\n'.join(lines) or None for lines in days])
+
+    workbook.save(path)
+
+
+def generate(directory, spec: SyntheticSpec = SyntheticSpec()) -> tuple[str, str, str]:
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    paths = directory / 'enrollment.xlsx', directory / 'lecture.xlsx', directory / 'period.xlsx'
+    write_enrollments(spec, paths[0])
+    write_lectures(spec, paths[1])
+    write_periods(spec, paths[2])
+
+    return tuple(map(str, paths))
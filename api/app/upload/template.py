@@ -1,16 +1,25 @@
-import copy
+import re
+from dataclasses import dataclass, replace
 from itertools import chain
+from typing import Iterable, Iterator
 
 import numpy as np
-import pandas as pd
+import structlog
+from openpyxl import load_workbook
 
 from app.upload.exceptions import ParseError
 from app.upload.schema import EnrollmentInfo, PeriodInfo, LectureInfo
 from app.util.common import is_empty, get_generation
 
+logger = structlog.get_logger()
 
 # __all__ = ['upload_students', 'upload_teachers']
 
+STUDENT_PATTERN = re.compile(r'[^\S ]*(\d{5})[^\S ]*(?: (.*))?', re.DOTALL) # 10101 홍길동
+CREDIT_PATTERN = re.compile(r'[^\S ]*(\d+)[^\S ]* 학점') # 25 학점
+CLASS_PATTERN = re.compile(r'(.*) [^\S ]*(\d+)[^\S ]*반 [^ ]*', re.DOTALL) # 수학 1반 301
+PERIOD_PATTERN = re.compile(r'\s*(\d+(?:\s*,\s*\d+)*)\s*\(\s*(\d+)\s*(?:분반)?\s*\)?\s*') # 1,2(1분반)
+
 class Cell[T]:
 
     def match(self, content: str) -> bool:
@@ -22,6 +31,24 @@ class Cell[T]:
     def name(self) -> str:
         raise NotImplementedError()
 
+    def key(self) -> object:
+        return self.__class__
+
+    def classify(self, content: str, cache: 'CellCache') -> tuple[bool, T | None]:
+        if not self.match(content):
+            return False, None
+
+        return True, self.interpret(content)
+
+    def mask(self, contents: np.ndarray, kinds: dict, cache: 'CellCache') -> np.ndarray:
+        # classify each distinct content once per cell kind
+        kind = self.key()
+        if kind not in kinds:
+            matched = (cache.classify(self, content)[0] for content in contents)
+            kinds[kind] = np.fromiter(matched, dtype=bool, count=len(contents))
+
+        return kinds[kind]
+
     def __len__(self) -> int:
         return 1      
 
@@ -31,19 +58,13 @@ class StudentCell(Cell[tuple[int, int, int, str]]):
     __type__ = 'student'
 
     def match(self, content) -> bool:
-        it, _, name = content.partition(" ")
-        it = it.strip()
-        if len(it) != 5 or not it.isdigit():
-            return False
-        
-        return True
+        return STUDENT_PATTERN.fullmatch(content) is not None
 
-    
     def interpret(self, content) -> tuple[int, int, int, str]:
-        it, _, name = content.partition(" ")
+        it, name = STUDENT_PATTERN.fullmatch(content).groups()
 
         grade, cls, num = int(it[0]), int(it[1:3]), int(it[3:])
-        return get_generation(grade), cls, num, name
+        return get_generation(grade), cls, num, name or ""
     
     def name(self) -> str:
         return StudentCell.__type__
@@ -54,16 +75,10 @@ class CreditCell(Cell[int]):
     __type__ = 'credit'
 
     def match(self, content: str) -> bool:
-        it, _, suffix = content.partition(" ")
-        it = it.strip()
-        if suffix != '학점' or not it.isdigit():
-            return False
-
-        return True
+        return CREDIT_PATTERN.fullmatch(content) is not None
     
     def interpret(self, content: str) -> int:
-        it, _, _ = content.partition(" ")
-        return int(it)
+        return int(CREDIT_PATTERN.fullmatch(content).group(1))
     
     def name(self) -> str:
         return CreditCell.__type__
@@ -74,22 +89,10 @@ class ClassCell(Cell[tuple[str, int]]):
     __type__ = 'class'
 
     def match(self, content: str) -> bool:
-        sep = content.split(" ")
-        if len(sep) < 3:
-            return False
-
-        div = content.split(" ")[-2]
-        div, suffix = div[:-1], div[-1]
-        div = div.strip()
-        if suffix != '반' or not div.isdigit():
-            return False
-        
-        return True
+        return CLASS_PATTERN.fullmatch(content) is not None
     
     def interpret(self, content: str) -> tuple[str, int]:
-        div = content.split(" ")[-2]
-        div, _ = div[:-1], div[-1]
-        lec = " ".join(content.split(" ")[:-2])
+        lec, div = CLASS_PATTERN.fullmatch(content).groups()
         return lec, int(div)
     
     def name(self) -> str:
@@ -150,33 +153,19 @@ class PeriodCell(Cell[list[tuple[int, int]]]):
 
     __type__ = 'period'
 
-    def match(self, content: str) -> bool: # TODO: 정규식 사용
-        contents = content.split("\n")
-        for content in contents:
-            divided = content.replace(")", "").split("(")
-            if len(divided) < 2:
-                return False
-
-            if not divided[1].replace("분반", "").strip().isdigit():
+    def match(self, content: str) -> bool:
+        for line in content.split("\n"):
+            if PERIOD_PATTERN.fullmatch(line) is None:
                 return False
-            
-            for period in divided[0].split(','):
-                if not period.strip().isdigit():
-                    return False
 
         return True
-        
-        
 
     def interpret(self, content: str) -> list[tuple[int, int]]:
-        contents = content.split("\n")
         result = []
-        for content in contents:
-            divided = content.replace(")", "").split("(")
-            division = int(divided[1].replace("분반", ""))
-            periods = list(map(int, divided[0].split(",")))
-            for period in periods:
-                result.append((division, period))
+        for line in content.split("\n"):
+            periods, division = PERIOD_PATTERN.fullmatch(line).groups()
+            for period in periods.split(","):
+                result.append((int(division), int(period)))
         return result       
             
     
@@ -200,12 +189,78 @@ class DelegateCell(Cell):
                 return cell.interpret(content)
 
         raise ValueError()
+
+    def key(self) -> object:
+        return tuple(cell.key() for cell in self.cells)
+
+    def classify(self, content: str, cache: 'CellCache') -> tuple[bool, object]:
+        for cell in self.cells:
+            matched, value = cache.classify(cell, content)
+            if matched:
+                return True, value
+
+        return False, None
+
+    def mask(self, contents: np.ndarray, kinds: dict, cache: 'CellCache') -> np.ndarray:
+        return np.logical_or.reduce([cell.mask(contents, kinds, cache) for cell in self.cells])
     
     def name(self) -> str:
         return self.cells[0].name()
 
 
 ## ===== Template ======
+@dataclass
+class MatchStats:
+    origins: int = 0
+    candidates: int = 0
+    hits: int = 0
+
+    def add(self, origins: int, candidates: int, hits: int):
+        self.origins += origins
+        self.candidates += candidates
+        self.hits += hits
+
+    @property
+    def pruning(self) -> float:
+        return 1 - self.candidates / self.origins if self.origins else 0.0
+
+    def __repr__(self) -> str:
+        return (f'[origins={self.origins}, candidates={self.candidates}, hits={self.hits}, '
+                f'pruning={self.pruning:.2%}]')
+
+
+class CellCache:
+
+    def __init__(self):
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def classify(self, cell: Cell, content: str) -> tuple[bool, object]:
+        key = (cell.key(), content)
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            entry = cell.classify(content, self)
+            self.entries[key] = entry
+        else:
+            self.hits += 1
+
+        return entry
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __repr__(self) -> str:
+        return f'[entries={len(self.entries)}, hits={self.hits}, misses={self.misses}, hit_rate={self.hit_rate:.2%}]'
+
+
+def to_contents(board: np.ndarray) -> np.ndarray:
+    return np.frompyfunc(str, 1, 1)(board)
+
+
 class Template:
 
     def __init__(self, template: list[list[Cell]]):
@@ -230,8 +285,11 @@ class Template:
     def stamp(self, board: np.ndarray, x, y) -> list[list]:
         if not self.match_at(board, x, y):
             return []
-        
-        h, w = board.shape 
+
+        return self.extract(board, x, y)
+
+    def extract(self, board: np.ndarray, x, y, cache: CellCache = None) -> list[list]:
+        h, w = board.shape
         contents = []
         for j in range(self.height):
             contents_row = []
@@ -243,7 +301,10 @@ class Template:
                 
                 content = str(board[y+j][x+i])
                 
-                content = cell.interpret(content)
+                if cache is None:
+                    content = cell.interpret(content)
+                else:
+                    _, content = cache.classify(cell, content)
 
                 contents_row.append((cell.name(), content))
 
@@ -251,11 +312,50 @@ class Template:
         return contents
 
 
-    def convolute(self, board: np.ndarray) -> dict[tuple[int], list[list]]:
+    # (y, x) origins of every match, in the same order as the naive scan
+    def search(self, board: np.ndarray, cache: CellCache, stats: MatchStats = None) -> np.ndarray:
+        h, w = board.shape
+        rows, cols = h - self.height + 1, w - self.width + 1
+        contents, inverse, counts = np.unique(to_contents(board), return_inverse=True, return_counts=True)
+        inverse = inverse.reshape(board.shape)
+
+        # anchor on the most selective cell, only its matches become candidate origins
+        kinds = {}
+        cells = [(j, i, cell) for j, row in enumerate(self.template) for i, cell in enumerate(row)]
+        anchor_j, anchor_i, anchor = min(cells, key=lambda c: counts[c[2].mask(contents, kinds, cache)].sum())
+
+        anchor_mask = anchor.mask(contents, kinds, cache)[inverse[anchor_j:anchor_j+rows, anchor_i:anchor_i+cols]]
+        ys, xs = np.nonzero(anchor_mask)
+        candidates = len(ys)
+
+        for j, i, cell in cells:
+            if (j, i) == (anchor_j, anchor_i) or not len(ys):
+                continue
+
+            matched = cell.mask(contents, kinds, cache)[inverse[ys + j, xs + i]]
+            ys, xs = ys[matched], xs[matched]
+
+        if stats is not None:
+            stats.add(origins=rows * cols, candidates=candidates, hits=len(ys))
+
+        return np.stack([ys, xs], axis=1)
+
+    def convolute(
+            self,
+            board: np.ndarray,
+            vectorized: bool = True,
+            stats: MatchStats = None,
+            cache: CellCache = None
+    ) -> dict[tuple[int], list[list]]:
         h, w = board.shape
         if h < self.height or w < self.width :
             return {}
 
+        if vectorized:
+            cache = cache if cache is not None else CellCache()
+            origins = self.search(board, cache, stats).tolist()
+            return { (i, j): self.extract(board, i, j, cache) for j, i in origins }
+
         result = {}        
         for j in range(h - self.height + 1):
             for i in range(w - self.width + 1):
@@ -267,8 +367,17 @@ class Template:
         
         return result
 
+    # windows are (row offset, block) pairs overlapping by height - 1 rows, see iter_board
+    def iter_convolute(self, windows, vectorized: bool = True, stats: MatchStats = None, cache: CellCache = None):
+        cache = cache if cache is not None else CellCache()
+        for offset, block in windows:
+            for (i, j), stamp in self.convolute(block, vectorized, stats, cache).items():
+                yield (i, j + offset), stamp
+
 
 ## ===== Template for Timetable =====
+TEMPLATE_VERSION = 2 # 템플릿이나 파싱 결과가 바뀌면 올릴 것, parse cache key에 포함됨
+
 EMPTY = EmptyCell()
 NAME = StudentCell()
 CREDIT = CreditCell()
@@ -295,20 +404,92 @@ template_room = Template([[SUBJECT, TEACHER, ROOM, TEACHER, ROOM, TEACHER, ROOM]
 template_period = Template([[DelegateCell(SUBJECT, EMPTY), TEACHER, PERIOD, PERIOD, PERIOD, PERIOD, PERIOD]])
 
 ## ===== Parsing Logic =====
-def get_board(path):
-    df = pd.read_excel(path)
-    board = df.to_numpy()
+HEADER_ROWS = 1 # first row is a title row, pd.read_excel used to take it as the header
+WINDOW_ROWS = 256
+
+def normalize(value) -> str:
+    if value is None:
+        return ""
+
+    return str(value)
+
+def read_rows(worksheet):
+    # trailing empty rows are dropped, empty rows in between are kept
+    pending = 0
+    for row in worksheet.iter_rows(min_row=HEADER_ROWS + 1, values_only=True):
+        row = [normalize(value) for value in row]
+        if not any(row):
+            pending += 1
+            continue
 
-    return board
+        for _ in range(pending):
+            yield []
+        pending = 0
+
+        yield row
+
+def to_block(rows: list[list[str]], width: int = 0) -> np.ndarray:
+    width = max(width, max(map(len, rows), default=0))
+    block = np.full((len(rows), width), "", dtype=object)
+    for y, row in enumerate(rows):
+        block[y, :len(row)] = row
+
+    return block
+
+def count_sheets(path) -> int:
+    workbook = load_workbook(path, read_only=True)
+    try:
+        return len(workbook.sheetnames)
+    finally:
+        workbook.close()
+
+def sheet_width(worksheet) -> int:
+    # sheets written in write-only mode have no dimension, the header row spans the columns like pd.read_excel
+    if worksheet.max_column:
+        return worksheet.max_column
+
+    header = next(worksheet.iter_rows(max_row=HEADER_ROWS, values_only=True), ())
+    return len(header)
+
+# streams (row offset, block) windows for a template of the given height,
+# consecutive windows share height - 1 rows so every origin is covered exactly once
+def iter_board(path, height: int, sheet: int = 0, chunk: int = WINDOW_ROWS):
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        worksheet = workbook.worksheets[sheet]
+        width = sheet_width(worksheet)
+
+        rows, offset = [], 0
+        for row in read_rows(worksheet):
+            rows.append(row)
+            if len(rows) < chunk + height - 1:
+                continue
+
+            yield offset, to_block(rows, width)
+
+            carry = len(rows) - (height - 1)
+            rows, offset = rows[carry:], offset + carry
+
+        if rows:
+            yield offset, to_block(rows, width)
+    finally:
+        workbook.close()
 
     
-def parse_enrollments(path: str) -> tuple[list[EnrollmentInfo], list[PeriodInfo]]:
-    board = get_board(path)
-    data = template.convolute(board)
-    student_info_list = []
-    period_info_list = []
-    for _, contents in data.items():
+def iter_matches(template: Template, path, sheet: int, kind: str):
+    # 시트 전체 대신 WINDOW_ROWS 행씩 읽고 찾은 stamp는 바로 넘긴다
+    stats, cache = MatchStats(), CellCache()
+    windows = iter_board(path, template.height, sheet)
+    for _, contents in template.iter_convolute(windows, stats=stats, cache=cache):
+        yield contents
+
+    logger.info(f'{kind} template matched', stats=str(stats), cache=str(cache))
+
+
+def iter_enrollments(path: str, sheet: int = 0) -> Iterator[tuple[EnrollmentInfo, tuple[PeriodInfo, ...]]]:
+    for contents in iter_matches(template, path, sheet, 'enrollments'):
         organized = {}
+        period_infos = {} # insertion-ordered set
         for j, row_content in enumerate(contents):
             for i, type_content in enumerate(row_content):
                 type = type_content[0]
@@ -318,25 +499,13 @@ def parse_enrollments(path: str) -> tuple[list[EnrollmentInfo], list[PeriodInfo]
                 
                 if type == 'class':
                     period_info = PeriodInfo(subject=content[0], teacher="Unknown", division=content[1], day=i+1, period=j)
-                    if period_info not in period_info_list:
-                        period_info_list.append(period_info)
-
-                if type in organized:
-                    if not isinstance(organized[type], list):
-                        organized[type] = [organized[type]]
+                    period_infos[period_info] = None
 
-                    if content not in organized[type]:
-                        organized[type].append(content)
+                organized.setdefault(type, {})[content] = None
 
-                    continue
-
-                organized[type] = content
-
-        student = organized['student']
-        classes = organized['class']
-        credit = organized['credit']
-        if not isinstance(classes, list):
-            classes = [classes]
+        student = next(iter(organized['student']))
+        classes = tuple(organized['class'])
+        credit = next(iter(organized['credit']))
 
         student_info = EnrollmentInfo(
             student[0],
@@ -346,9 +515,16 @@ def parse_enrollments(path: str) -> tuple[list[EnrollmentInfo], list[PeriodInfo]
             credit,
             classes
         )
+        yield student_info, tuple(period_infos)
+
+def parse_enrollments(path: str, sheet: int = 0) -> tuple[list[EnrollmentInfo], list[PeriodInfo]]:
+    student_info_list = []
+    period_info_list = {} # insertion-ordered set
+    for student_info, period_infos in iter_enrollments(path, sheet):
         student_info_list.append(student_info)
+        period_info_list.update(dict.fromkeys(period_infos))
 
-    return student_info_list, period_info_list
+    return student_info_list, list(period_info_list)
 
 
 def find(type: str, contents):
@@ -358,11 +534,8 @@ def find(type: str, contents):
 
     return None
 
-def parse_lectures(path: str) -> list[LectureInfo]:
-    board = get_board(path)
-    data = template_room.convolute(board)
-    lecture_info_list = []
-    for _, contents in data.items():
+def iter_lectures(path: str, sheet: int = 0) -> Iterator[LectureInfo]:
+    for contents in iter_matches(template_room, path, sheet, 'lectures'):
         contents = list(chain.from_iterable(contents))
         subject = str(find('subject', contents)).strip().replace("\n", "")
         for idx, (type, content) in enumerate(contents):
@@ -374,20 +547,16 @@ def parse_lectures(path: str) -> list[LectureInfo]:
                 if not room:
                     raise ParseError(f'room is none', teacher=content)
                 
-                lecture_info = LectureInfo(subject=subject, teacher=content, room=room)
-                if lecture_info not in lecture_info_list:
-                    lecture_info_list.append(lecture_info)
+                yield LectureInfo(subject=subject, teacher=content, room=room)
 
-    return lecture_info_list
+def parse_lectures(path: str, sheet: int = 0) -> list[LectureInfo]:
+    return list(dict.fromkeys(iter_lectures(path, sheet)))
 
 
 PERIOD_START_COL = 2
-def parse_periods(path: str) -> list[PeriodInfo]:
-    board = get_board(path)
-    data = template_period.convolute(board)
-    period_info_list = []
+def iter_periods(path: str, sheet: int = 0) -> Iterator[PeriodInfo]:
     subject_cache = "None" # if subject is none, use latest subject
-    for _, contents in data.items():
+    for contents in iter_matches(template_period, path, sheet, 'periods'):
         contents = list(chain.from_iterable(contents))
         subject, teacher, periods = "", "", []
         for idx, type_content in enumerate(contents):
@@ -417,17 +586,19 @@ def parse_periods(path: str) -> list[PeriodInfo]:
 
 
         for period in periods:
-            period_info = PeriodInfo(subject=subject, teacher=teacher, division=period[0], day=period[1], period=period[2]) 
-            period_info_list.append(period_info)
+            yield PeriodInfo(subject=subject, teacher=teacher, division=period[0], day=period[1], period=period[2])
 
-    return period_info_list
+def parse_periods(path: str, sheet: int = 0) -> list[PeriodInfo]:
+    return list(iter_periods(path, sheet))
 
 # TODO: 추후에 엑셀을 다듬는 프로그램을 새로 만들어야 할 듯
-def unify_periods(periods: list[PeriodInfo], muti_tch_period: list[PeriodInfo], lectures: list[LectureInfo]) -> list[PeriodInfo]:
-    period_info_list = copy.deepcopy(muti_tch_period)
-    multi_tch_subject = []
-    for period in muti_tch_period:
-        multi_tch_subject.append(period.subject)
+def iter_unify_periods(
+        periods: Iterable[PeriodInfo],
+        muti_tch_period: list[PeriodInfo],
+        lectures: list[LectureInfo]
+) -> Iterator[PeriodInfo]:
+    # 교사 정보가 필요한 시간만 모아두고 수강 신청 파일의 시간은 하나씩 바꿔서 넘긴다
+    multi_tch_subject = {period.subject for period in muti_tch_period}
 
     subject_teacher_map = {}
     for lecture in lectures:
@@ -436,11 +607,13 @@ def unify_periods(periods: list[PeriodInfo], muti_tch_period: list[PeriodInfo],
 
         subject_teacher_map[lecture.subject] = lecture.teacher
 
+    yield from muti_tch_period
     for period in periods:
         if period.subject in multi_tch_subject:
             continue
 
-        period.teacher = subject_teacher_map[period.subject]
-        period_info_list.append(period)
-    
-    return period_info_list
\ No newline at end of file
+        # records are immutable, so the parsed lists can be shared instead of deep-copied
+        yield replace(period, teacher=subject_teacher_map[period.subject])
+
+def unify_periods(periods: list[PeriodInfo], muti_tch_period: list[PeriodInfo], lectures: list[LectureInfo]) -> list[PeriodInfo]:
+    return list(iter_unify_periods(periods, muti_tch_period, lectures))
@@ -1,97 +1,79 @@
+from itertools import batched
+from typing import Iterable, Iterator
+
 import structlog
-from sqlalchemy import insert
+import ulid
+from sqlalchemy import update, insert, exists, literal, Table
 
 from app.auth.crud import *
+from app.core.database import generate_ulid, ulid_sql, Hex
+from app.util.common import generate_tokens
+from .bulk import bulk_insert, apply_diff, insert_missing
+from .context import ImportContext
 from .exceptions import UploadError
+from .staging import Staging
 from .template import *
+from ..sync.model import SyncStatus
+from ..theme.model import Theme, ColorScheme
 from ..timetable.model import Class, Subject, Lecture, Enrollment, Period
 
 logger = structlog.get_logger()
-async def bulk_create_students(session: AsyncSession, user_info_datas: list[UserInfoData]):
-    if not user_info_datas:
-        return 0
-
-    generations = set([d.generation for d in user_info_datas])
 
-    stmt = select(UserInfo).where(
-        UserInfo.role.op('&')(Role.STUDENT) != 0,
-        UserInfo.generation.in_(generations)
-    )
-    existing_users = (await session.execute(stmt)).scalars().all()
-    existing_keys = { (user.generation, user.clazz, user.number, user.name) for user in existing_users }
+async def insert_user_infos(context: ImportContext, rows: list[dict]):
+    # ULID와 토큰을 직접 만들어서 flush 없이 executemany로 넣는다
+    tokens = generate_tokens(len(rows))
+    await bulk_insert(context.session, UserInfo, rows)
+    await bulk_insert(context.session, IdentifyToken, [
+        {'token_id': token, 'user_info_id': row['user_info_id']} for token, row in zip(tokens, rows)
+    ])
 
+async def bulk_create_students(context: ImportContext, user_info_datas: Iterable[UserInfoData]):
     unique_users = { (user.generation, user.clazz, user.number, user.name): user for user in user_info_datas}
 
     new_users = []
     for key, user in unique_users.items():
-        if key not in existing_keys:
-            user_info = UserInfo(
-                name=user.name,
-                role=Role.STUDENT,
-                generation=user.generation,
-                clazz=user.clazz,
-                number=user.number,
-                credit=user.credit
-            )
-            new_users.append(user_info)
-
-    if not new_users:
-        return 0
-
-    session.add_all(new_users)
-    await session.flush()
-
-    new_tokens = [
-        IdentifyToken(user_info_id=user_info.user_info_id) for user_info in new_users
-    ]
-    session.add_all(new_tokens)
-
-    return len(new_users)
+        if key in context.students:
+            continue
 
+        user_info_id = generate_ulid()
+        new_users.append({
+            'user_info_id': user_info_id,
+            'name': user.name,
+            'role': Role.STUDENT,
+            'generation': user.generation,
+            'clazz': user.clazz,
+            'number': user.number,
+            'credit': user.credit,
+        })
+        context.students[key] = user_info_id
 
-async def bulk_create_teachers(session: AsyncSession, user_info_datas: list[UserInfoData]):
-    if not user_info_datas:
-        return 0
+    await insert_user_infos(context, new_users)
+    return len(new_users)
 
-    stmt = select(UserInfo).where(
-        UserInfo.role.op('&')(Role.TEACHER) != 0
-    )
-    existing_users = (await session.execute(stmt)).scalars().all()
-    existing_keys = {user.name for user in existing_users}
 
+async def bulk_create_teachers(context: ImportContext, user_info_datas: list[UserInfoData]):
     unique_users = {user.name: user for user in user_info_datas}
 
     new_users = []
-    for key, user in unique_users.items():
-        if key not in existing_keys:
-            user_info = UserInfo(
-                name=user.name,
-                role=Role.TEACHER,
-            )
-            new_users.append(user_info)
-
-    if not new_users:
-        return 0
-
-    session.add_all(new_users)
-    await session.flush()
+    for name in unique_users:
+        if name in context.teachers:
+            continue
 
-    new_tokens = [
-        IdentifyToken(user_info_id=user_info.user_info_id) for user_info in new_users
-    ]
-    session.add_all(new_tokens)
+        user_info_id = generate_ulid()
+        new_users.append({'user_info_id': user_info_id, 'name': name, 'role': Role.TEACHER})
+        context.teachers[name] = user_info_id
 
+    await insert_user_infos(context, new_users)
     return len(new_users)
 
-async def upload_students(students: list[EnrollmentInfo], session: AsyncSession):
-    students = [UserInfoData(s.name, s.generation, s.clazz, s.number, s.credit) for s in students]
+async def upload_students(students: Iterable[EnrollmentInfo], context: ImportContext):
+    students = (UserInfoData(s.name, s.generation, s.clazz, s.number, s.credit) for s in students)
 
-    len_users = await bulk_create_students(session, students)
-    await session.commit()
+    len_users = await bulk_create_students(context, students)
     logger.info(f'{len_users} students uploaded')
 
 
-async def upload_teachers(teachers: list[LectureInfo], session: AsyncSession):
+async def upload_teachers(teachers: list[LectureInfo], context: ImportContext):
     teacher_names = set()
 
     for lecture in teachers:
@@ -99,178 +81,207 @@ async def upload_teachers(teachers: list[LectureInfo], session: AsyncSession):
         teacher_names.update(names)
 
     teachers = [UserInfoData(t) for t in teacher_names]
-    len_teachers = await bulk_create_teachers(session, teachers)
-    await session.commit()
+    len_teachers = await bulk_create_teachers(context, teachers)
     logger.info(f'{len_teachers} teacher uploaded')
 
 
-async def upload_enrollments(students: list[EnrollmentInfo], session: AsyncSession):
-    stmt = select(UserInfo).where(UserInfo.role.op('&')(Role.STUDENT) != 0)
-    all_students = (await session.execute(stmt)).scalars().all()
-    student_map = { (s.generation, s.clazz, s.number): s.user_info_id for s in all_students }
-
-    stmt = select(Class).join(Class.lecture).join(Lecture.subject).options(
-        joinedload(Class.lecture).joinedload(Lecture.subject)
-    )
-    all_classes = (await session.execute(stmt)).scalars().all()
-    class_map = dict()
-    for c in all_classes:
-        key = (c.lecture.subject.name, c.division)
-        if key not in class_map:
-            class_map[key] = []
-
-        class_map[key].append(c.class_id)
-
-    new_objects = []
+def iter_enrollment_keys(students: Iterable[EnrollmentInfo], context: ImportContext) -> Iterator[tuple]:
+    # (class_id, user_info_id), 학생 하나씩 바꿔서 넘긴다
     for student in students:
-        key = (student.generation, student.clazz, student.number)
+        key = (student.generation, student.clazz, student.number, student.name)
 
-        if key not in student_map:
+        if key not in context.students:
             raise UploadError('Cannot find student', student=student)
 
-        student_id = student_map[key]
+        student_id = context.students[key]
         for subject_name, division in student.subjects:
             key = (subject_name, division)
-            if key not in class_map:
+            if key not in context.subject_classes:
                 raise UploadError('Cannot find class', key=key)
 
-            class_ids = class_map[key]
+            class_ids = context.subject_classes[key]
             for class_id in class_ids:
-                new_objects.append({
-                    'class_id': class_id,
-                    'user_info_id': student_id,
-                })
-
-    if new_objects:
-        stmt = insert(Enrollment).values(new_objects).prefix_with('IGNORE')
-        await session.execute(stmt)
-
-    await session.commit()
-
-async def upload_lectures(lectures: list[LectureInfo], session: AsyncSession):
+                yield class_id, student_id
+
+def touch_keys(keys: Iterable[tuple], context: ImportContext) -> Iterator[tuple]:
+    # 호출한 쪽이 원할 때만 올린 전부를 바뀐 것으로 친다, 학교 전체의 버전을 올리고 테마를 채운다
+    for key in keys:
+        context.enrollments_changed([key])
+        yield key
+
+async def upload_enrollments(
+        students: Iterable[EnrollmentInfo],
+        context: ImportContext,
+        diff: bool = False,
+        staging: Staging = None
+):
+    keys = iter_enrollment_keys(students, context)
+    if context.touch_all:
+        keys = touch_keys(keys, context)
+
+    session = context.session
+    if staging is not None:
+        result = await staging.apply(session, Enrollment, ('class_id', 'user_info_id'), keys,
+                                     scope=context.student_scope(), remove=diff, on_changed=context.enrollments_changed)
+    elif diff:
+        result = await apply_diff(session, Enrollment, ('class_id', 'user_info_id'), keys, copy=True,
+                                  scope=context.student_scope(), on_changed=context.enrollments_changed)
+    else:
+        # 빠진 수강 신청은 지우지 않고 chunk 단위로 새 행만 넣는다, 바뀐 것은 새로 들어간 행뿐이다
+        result = await insert_missing(session, Enrollment, ('class_id', 'user_info_id'), keys, copy=True,
+                                      on_changed=context.enrollments_changed)
+
+    return result
+
+async def upload_lectures(lectures: list[LectureInfo], context: ImportContext):
     unique_subjects = { l.subject for l in lectures }
 
-    # query subjects
-    stmt = select(Subject).where(Subject.name.in_(unique_subjects))
-    subjects = (await session.execute(stmt)).scalars().all()
-    subject_map = { s.name: s.subject_id for s in subjects }
-
     # create subject if not exists
     new_subjects = []
     for name in unique_subjects:
-        if name not in subject_map.keys():
-            subject = Subject(name=name)
-            new_subjects.append(subject)
+        if name not in context.subjects:
+            subject_id = generate_ulid()
+            new_subjects.append({'subject_id': subject_id, 'name': name})
+            context.subjects[name] = subject_id
 
-    session.add_all(new_subjects)
-    await session.flush()
-
-    for subject in new_subjects:
-        subject_map[subject.name] = subject.subject_id
-
-    teacher_names = set()
-    for l in lectures:
-        teacher_names.update(map(str.strip, l.teacher.split(",")))
-
-    # === query teachers ===
-    stmt = select(UserInfo).where(
-        UserInfo.name.in_(teacher_names),
-        UserInfo.role.op('&')(Role.TEACHER) != 0)
-    teachers = (await session.execute(stmt)).scalars().all()
-    teacher_map = { t.name : t.user_info_id for t in teachers }
-
-    stmt = (select(Lecture)
-            .join(Lecture.subject)
-            .where(Lecture.subject_id.in_(subject_map.values()))
-            .options(joinedload(Lecture.subject), joinedload(Lecture.teacher_info)))
-    existing_lectures = (await session.execute(stmt)).scalars().all()
-    existing_lecture_keys = set([(l.subject.name, l.teacher_info.name, l.room) for l in existing_lectures])
+    await bulk_insert(context.session, Subject, new_subjects)
 
     # === add new lectures ===
     new_objects = []
     for l in lectures:
         teacher_name = l.teacher.split(",")[0].strip()
-        if teacher_name not in teacher_map.keys():
+        if teacher_name not in context.teachers:
             raise UploadError('cannot find teacher', lecture=l)
 
         key = (l.subject, teacher_name, l.room)
-        if key in existing_lecture_keys:
+        if key in context.lectures:
             continue
 
-        subject = subject_map[l.subject]
-        teacher = teacher_map[teacher_name]
-        lecture = Lecture(subject_id=subject, teacher_info_id=teacher, room=l.room)
-        new_objects.append(lecture)
-
-    session.add_all(new_objects)
-    await session.commit()
-
+        lecture_id = generate_ulid()
+        new_objects.append({
+            'lecture_id': lecture_id,
+            'subject_id': context.subjects[l.subject],
+            'teacher_info_id': context.teachers[teacher_name],
+            'room': l.room,
+        })
+        context.add_lecture(lecture_id, l.subject, teacher_name, l.room)
 
-async def upload_periods(periods: list[PeriodInfo], session: AsyncSession):
-    # === query subjects ===
-    subjects = set([p.subject for p in periods])
-    stmt = select(Subject).where(Subject.name.in_(subjects))
-    subjects = (await session.execute(stmt)).scalars().all()
-    subject_map = { s.name: s.subject_id for s in subjects }
+    await bulk_insert(context.session, Lecture, new_objects)
 
-    # === query teachers ===
-    teacher_names = set()
-    for p in periods:
-        teacher_names.update(map(str.strip, p.teacher.split(",")))
-    stmt = select(UserInfo).where(UserInfo.name.in_(teacher_names),
-                                  UserInfo.role.op('&')(Role.TEACHER) != 0)
-    teachers = (await session.execute(stmt)).scalars().all()
-    teacher_map = { t.name: t.user_info_id for t in teachers }
-
-    stmt = (select(Lecture)
-            .join(Lecture.subject)
-            .join(Lecture.teacher_info)
-            .where(Subject.name.in_(subject_map.keys()),
-                   Lecture.teacher_info_id.in_(teacher_map.values()))
-            .options(joinedload(Lecture.subject),
-                     joinedload(Lecture.teacher_info)))
-    lectures = (await session.execute(stmt)).scalars().all()
-    lecture_map = { (l.subject.name, l.teacher_info.name): l.lecture_id for l in lectures }
-
-    # === create classe ===
-    stmt = select(Class).where(Class.lecture_id.in_(lecture_map.values()))
-    classes = (await session.execute(stmt)).scalars().all()
-
-    class_map = { (c.lecture_id, c.division): c for c in classes }
 
+async def upload_periods(
+        periods: Iterable[PeriodInfo],
+        context: ImportContext,
+        diff: bool = False,
+        staging: Staging = None,
+        subjects: set[tuple[str, int]] = None
+):
+    # subjects는 범위 안의 학생이 듣는 (과목, 분반), 학년 범위가 있을 때만 쓴다
     new_classes = []
     new_periods = []
     for p in periods:
         teacher_name = p.teacher.split(',')[0].strip()
-        lecture_id = lecture_map.get((p.subject, teacher_name))
+        lecture_id = context.lecture_ids.get((p.subject, teacher_name))
 
         if not lecture_id:
             raise UploadError(f'too many lectures', period=p)
 
         class_key = (lecture_id, p.division)
-        clazz = class_map.get(class_key)
-        if clazz is None:
-            clazz = Class(lecture_id=lecture_id, division=p.division)
-            new_classes.append(clazz)
-            class_map[class_key] = clazz
+        class_id = context.classes.get(class_key)
+        if class_id is None:
+            class_id = generate_ulid()
+            new_classes.append({'class_id': class_id, 'lecture_id': lecture_id, 'division': p.division})
+            context.add_class(class_id, lecture_id, p.division)
 
         new_periods.append({
-            'clazz': clazz, 'period': p.period, 'day': p.day
+            'class_id': class_id, 'period': p.period, 'day': p.day
         })
-    if new_classes:
-        session.add_all(new_classes)
-        await session.flush()
-
-    if new_periods:
-        period_data = []
-        for p in new_periods:
-            period_data.append({
-                'class_id': p['clazz'].class_id,
-                'period': p['period'],
-                'day': p['day']
-            })
-
-        stmt = insert(Period).values(period_data).prefix_with('IGNORE')
+
+    session = context.session
+    await bulk_insert(session, Class, new_classes)
+
+    targets = [(p['class_id'], p['period'], p['day']) for p in new_periods]
+    scope = None
+    if context.generations is not None:
+        # 범위 안의 학생이 듣는 수업의 시간만 비교하고 쓴다, 다른 학년만 듣는 수업의 시간은 워크북에 있어도 그대로 둔다
+        classes = {c for key in subjects or () for c in context.subject_classes.get(key, ())}
+        targets = [t for t in targets if t[0] in classes]
+        scope = Period.class_id.in_(classes)
+
+    if staging is not None:
+        result = await staging.apply(session, Period, ('class_id', 'period', 'day'), targets, scope=scope,
+                                     remove=diff, on_changed=context.periods_changed)
+    elif diff:
+        result = await apply_diff(session, Period, ('class_id', 'period', 'day'), targets, copy=True, scope=scope,
+                                  on_changed=context.periods_changed)
+    else:
+        result = await insert_missing(session, Period, ('class_id', 'period', 'day'), targets, copy=True,
+                                      on_changed=context.periods_changed)
+
+    if context.touch_all:
+        context.periods_changed(targets)
+    return result
+
+
+async def affected_students(context: ImportContext, enrollments: Table = Enrollment.__table__) -> set[ulid.ULID]:
+    # 바뀐 수업의 수강생과 수강 신청이 바뀐 학생, 나머지 학생의 시간표는 그대로다
+    students = set(context.changed_students)
+    for chunk in batched(context.changed_classes, configs.UPLOAD_CHUNK_ROWS):
+        stmt = select(enrollments.c.user_info_id).where(enrollments.c.class_id.in_(chunk)).distinct()
+        students.update((await context.session.execute(stmt)).scalars())
+
+    return students
+
+async def bump_timetable_versions(context: ImportContext, students: set[ulid.ULID]) -> int:
+    # 영향받은 학생만 새 버전을 받고, 나머지는 /timetable/status에서 그대로 끝난다
+    version = generate_ulid()
+    total = 0
+    for chunk in batched(students, configs.UPLOAD_CHUNK_ROWS):
+        users = select(User.user_id).where(User.user_info_id.in_(chunk))
+        stmt = (update(SyncStatus).where(SyncStatus.user_id.in_(users)).values(timetable_version=version)
+                .execution_options(synchronize_session=False))
+        total += (await context.session.execute(stmt)).rowcount
+
+    logger.info('timetable versions bumped', classes=len(context.changed_classes), students=len(students), users=total)
+    return total
+
+async def backfill_color_schemes(
+        context: ImportContext,
+        students: set[ulid.ULID],
+        enrollments: Table = Enrollment.__table__
+) -> int:
+    # 새로 듣게 된 과목의 색을 기존 테마에 채운다, Core INSERT ... SELECT라 app/sync/hooks.py의 행 단위 listener는 돌지 않는다
+    session = context.session
+    dialect = session.get_bind().dialect.name
+    version = generate_ulid()
+    total = 0
+    for chunk in batched(students, configs.UPLOAD_CHUNK_ROWS):
+        missing = (select(Theme.theme_id, Theme.owner_id, Lecture.subject_id)
+                   .join(User, User.user_id == Theme.owner_id)
+                   .join(enrollments, enrollments.c.user_info_id == User.user_info_id)
+                   .join(Class, Class.class_id == enrollments.c.class_id)
+                   .join(Lecture, Lecture.lecture_id == Class.lecture_id)
+                   .where(User.user_info_id.in_(chunk),
+                          ~exists().where(ColorScheme.theme_id == Theme.theme_id,
+                                          ColorScheme.subject_id == Lecture.subject_id))
+                   .distinct())
+
+        owners = set((await session.execute(select(missing.subquery().c.owner_id).distinct())).scalars())
+        if not owners:
+            continue
+
+        pairs = missing.subquery()
+        stmt = insert(ColorScheme).from_select(
+            ['color_scheme_id', 'theme_id', 'subject_id', 'color', 'text_color'],
+            select(ulid_sql(dialect), pairs.c.theme_id, pairs.c.subject_id,
+                   literal(configs.THEME_DEFAULT_COLOR, Hex(6)), literal(configs.THEME_DEFAULT_TEXT_COLOR, Hex(6)))
+        )
+        total += (await session.execute(stmt)).rowcount
+
+        # listener 대신 주인마다 theme_version을 한 번만 올린다
+        stmt = (update(SyncStatus).where(SyncStatus.user_id.in_(owners)).values(theme_version=version)
+                .execution_options(synchronize_session=False))
         await session.execute(stmt)
 
-    await session.commit()
+    logger.info('color schemes backfilled', students=len(students), schemes=total)
+    return total
@@ -5,8 +5,6 @@ import random
 from datetime import datetime
 from typing import Any
 
-import pandas as pd
-
 from app.core.config import configs
 
 
@@ -24,6 +22,25 @@ def hash_with_base64(data, length: int):
 
     return hashed_b64 
 
+def combine_hashes(*digests: bytes) -> str:
+    hasher = hashlib.sha256()
+    for digest in digests:
+        hasher.update(digest)
+
+    return hasher.hexdigest()
+
+def hash_files(*paths, chunk_size: int = 1024 * 1024) -> str:
+    digests = []
+    for path in paths:
+        file_hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            while chunk := f.read(chunk_size):
+                file_hasher.update(chunk)
+
+        digests.append(file_hasher.digest())
+
+    return combine_hashes(*digests)
+
 def create_id(s1, s2, s3 = None):
     if s3 is None:
         s3 = random.randrange(0, 999)
@@ -39,20 +56,13 @@ def is_empty(value: Any) -> bool:
     if value is None:
         return True
 
-    # pandas/NumPy NaN
+    # NumPy NaN
     try:
         if isinstance(value, float) and math.isnan(value):
             return True
     except TypeError:
         pass
 
-    # pandas.isna (np.nan, pd.NA 등)
-    try:
-        if pd.isna(value):
-            return True
-    except TypeError:
-        pass
-
     # 문자열 처리
     if isinstance(value, str):
         if value.strip() == "":
@@ -76,4 +86,11 @@ def generate_token():
         idx = random.randint(0, len(token_char) - 1)
         token += token_char[idx]
 
-    return token
\ No newline at end of file
+    return token
+
+def generate_tokens(count: int) -> list[str]:
+    tokens = {} # insertion-ordered set, no duplicates inside a batch
+    while len(tokens) < count:
+        tokens[''.join(random.choices(token_char, k=configs.ID_TOKEN_LENGTH))] = None
+
+    return list(tokens)
@@ -11,10 +11,12 @@ from app.auth.router import router as auth_router
 from app.core.config import configs
 from app.core.database import engine, Base
 from app.core.exceptions import handle_client_exception, ClientError, global_error_handler, validation_exception_handler
-from app.core.middleware import RequestLogMiddleware
+from app.core.middleware import RequestLogMiddleware, BodyLimitMiddleware
+from app.core.migration import migrate
 from app.theme.router import router as theme_router
 from app.timetable.router import router as timetable_router
-from app.upload.router import router as upload_router
+from app.upload.pool import shutdown_executor
+from app.upload.router import router as upload_router, UPLOAD_FORM_OVERHEAD
 from app.account.router import router as account_router
 from app.util.logger import configure_logger
 
@@ -22,7 +24,9 @@ from app.util.logger import configure_logger
 async def lifespan(app: FastAPI):
     async with engine.begin() as e:
         await e.run_sync(Base.metadata.create_all)
+        await e.run_sync(migrate)
     yield
+    shutdown_executor()
 
 app = FastAPI(
     debug=configs.DEBUG,
@@ -34,6 +38,11 @@ app.include_router(timetable_router)
 app.include_router(upload_router)
 app.include_router(account_router)
 
+# 워크북 세 개와 form 필드, 넘으면 Starlette가 임시 파일에 받기 전에 413
+app.add_middleware(BodyLimitMiddleware, limits={
+    '/upload/jobs': 3 * configs.UPLOAD_MAX_BYTES + UPLOAD_FORM_OVERHEAD,
+})
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -0,0 +1,48 @@
+import os
+
+# app.core.config는 import할 때 환경 변수를 읽는다
+for key, value in {'DEBUG': 'true', 'SQL_DATABASE': 'test', 'JWT_SECRET': 'test', 'ID_TOKEN_LENGTH': '8'}.items():
+    os.environ.setdefault(key, value)
+
+import asyncio
+
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.pool import NullPool
+
+
+@pytest.fixture(params=['sqlite', 'postgresql'])
+def sessionmaker(request, tmp_path):
+    # 테스트마다 빈 데이터베이스, asyncio.run마다 loop가 바뀌므로 커넥션을 풀에 남기지 않는다
+    # PostgreSQL은 TEST_POSTGRESQL_URL (postgresql+asyncpg://...)이 있을 때만, 테스트마다 모든 테이블을 다시 만든다
+    import app.auth.model, app.sync.model, app.theme.model, app.timetable.model, app.upload.model
+    from app.core.database import Base, create_engine
+
+    if request.param == 'sqlite':
+        url = f'sqlite+aiosqlite:///{tmp_path / "test.db"}'
+    else:
+        url = os.environ.get('TEST_POSTGRESQL_URL')
+        if not url:
+            pytest.skip('TEST_POSTGRESQL_URL is not set')
+
+    engine = create_engine(url, poolclass=NullPool)
+
+    async def create():
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.drop_all)
+            await connection.run_sync(Base.metadata.create_all)
+
+    asyncio.run(create())
+    return async_sessionmaker(engine, expire_on_commit=False, autoflush=False)
+
+@pytest.fixture
+def run(sessionmaker):
+    # work(session)을 새 session 하나에서 돌리고 결과를 돌려준다
+    def run(work):
+        async def main():
+            async with sessionmaker() as session:
+                return await work(session)
+
+        return asyncio.run(main())
+
+    return run
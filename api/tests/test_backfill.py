@@ -0,0 +1,91 @@
+import asyncio
+from collections import Counter
+
+import ulid
+from sqlalchemy import event, select, insert
+
+from app.auth.crud import Role
+from app.auth.model import User, UserInfo
+from app.core.config import configs
+from app.core.database import generate_ulid
+from app.sync.model import SyncStatus
+from app.theme.model import Theme, ColorScheme
+from app.timetable.model import Subject, Lecture, Class, Enrollment
+from app.upload.context import ImportContext
+from app.upload.upload import backfill_color_schemes
+
+def test_backfill_bumps_each_owner_once(sessionmaker, monkeypatch):
+    monkeypatch.setattr(configs, 'UPLOAD_CHUNK_ROWS', 1) # 학생마다 chunk 하나
+    ids = {name: generate_ulid() for name in ('a', 'b', 'c', 'd')} # d는 계정이 없다
+    teacher = generate_ulid()
+    users = {name: generate_ulid() for name in ('a', 'b', 'c')}
+    themes = {name: generate_ulid() for name in ('a1', 'a2', 'b', 'c')}
+    subjects = {name: generate_ulid() for name in ('math', 'science')}
+    lectures = {name: generate_ulid() for name in subjects}
+    classes = {name: generate_ulid() for name in subjects}
+    versions = {user: generate_ulid() for user in users.values()}
+
+    async def seed(session):
+        await session.execute(insert(UserInfo), [
+            {'user_info_id': i, 'name': n, 'role': Role.STUDENT, 'generation': 1} for n, i in ids.items()
+        ] + [{'user_info_id': teacher, 'name': 't', 'role': Role.TEACHER}])
+        await session.execute(insert(User), [
+            {'user_id': u, 'username': n, 'password': 'x', 'email': f'{n}@x', 'user_info_id': ids[n]}
+            for n, u in users.items()
+        ])
+        await session.execute(insert(SyncStatus), [
+            {'user_id': u, 'timetable_version': v, 'theme_version': v} for u, v in versions.items()
+        ])
+        await session.execute(insert(Theme), [
+            {'theme_id': t, 'owner_id': users[n[0]], 'title': n} for n, t in themes.items()
+        ])
+        await session.execute(insert(Subject), [{'subject_id': s, 'name': n} for n, s in subjects.items()])
+        await session.execute(insert(Lecture), [
+            {'lecture_id': lectures[n], 'subject_id': s, 'teacher_info_id': teacher} for n, s in subjects.items()
+        ])
+        await session.execute(insert(Class), [
+            {'class_id': classes[n], 'lecture_id': lectures[n], 'division': 1} for n in subjects
+        ])
+        await session.execute(insert(Enrollment), [
+            {'class_id': classes['math'], 'user_info_id': ids['a']},
+            {'class_id': classes['science'], 'user_info_id': ids['a']},
+            {'class_id': classes['math'], 'user_info_id': ids['b']},
+            {'class_id': classes['math'], 'user_info_id': ids['c']},
+            {'class_id': classes['math'], 'user_info_id': ids['d']},
+        ])
+        # b는 이미 math 색이 있다
+        await session.execute(insert(ColorScheme), [
+            {'theme_id': themes['b'], 'subject_id': subjects['math'], 'color': 'ffffff', 'text_color': '000000'}
+        ])
+
+    bumps = Counter()
+    def count(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('UPDATE sync_statuses SET theme_version'):
+            bumps.update(ulid.from_bytes(p) for p in parameters[1:])
+
+    async def main():
+        async with sessionmaker() as session:
+            await seed(session)
+            event.listen(session.get_bind(), 'before_cursor_execute', count)
+            context = ImportContext(session)
+            students = set(ids.values())
+            total = await backfill_color_schemes(context, students)
+            again = await backfill_color_schemes(context, students) # 채울 것이 없으면 버전도 그대로
+            event.remove(session.get_bind(), 'before_cursor_execute', count)
+
+            schemes = Counter((await session.execute(select(ColorScheme.theme_id, ColorScheme.subject_id))).tuples())
+            after = dict((await session.execute(select(SyncStatus.user_id, SyncStatus.theme_version))).tuples().all())
+            return total, again, schemes, after
+
+    total, again, schemes, after = asyncio.run(main())
+    assert (total, again) == (5, 0)
+    assert set(schemes.values()) == {1}
+    assert set(schemes) == {
+        (themes['a1'], subjects['math']), (themes['a1'], subjects['science']),
+        (themes['a2'], subjects['math']), (themes['a2'], subjects['science']),
+        (themes['b'], subjects['math']), (themes['c'], subjects['math']),
+    }
+    # a는 테마가 두 개여도 한 번, 채운 것이 없는 b는 그대로
+    assert bumps == {users['a']: 1, users['c']: 1}
+    assert after[users['b']] == versions[users['b']]
+    assert all(after[users[n]] != versions[users[n]] for n in ('a', 'c'))
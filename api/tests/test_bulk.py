@@ -0,0 +1,127 @@
+from sqlalchemy import MetaData, select, insert
+
+from app.auth.crud import Role
+from app.auth.model import UserInfo
+from app.core.database import generate_ulid
+from app.timetable.model import Subject, Lecture, Class, Enrollment
+from app.upload.bulk import apply_diff, insert_missing, bulk_insert, copy_supported
+from app.upload.context import ImportContext
+
+KEYS = ('class_id', 'user_info_id')
+
+async def seed(session) -> tuple[dict, list]:
+    # 1기 두 명, 2기 한 명, 수업 세 개, PostgreSQL은 foreign key를 확인하므로 수업도 실제로 만든다
+    students = {name: generate_ulid() for name in ('a', 'b', 'c')}
+    teacher, subject, lecture = generate_ulid(), generate_ulid(), generate_ulid()
+    await session.execute(insert(UserInfo), [
+        {'user_info_id': students['a'], 'name': 'a', 'role': Role.STUDENT, 'generation': 1},
+        {'user_info_id': students['b'], 'name': 'b', 'role': Role.STUDENT, 'generation': 1},
+        {'user_info_id': students['c'], 'name': 'c', 'role': Role.STUDENT, 'generation': 2},
+        {'user_info_id': teacher, 'name': 't', 'role': Role.TEACHER},
+    ])
+    classes = [generate_ulid() for _ in range(3)]
+    await session.execute(insert(Subject), [{'subject_id': subject, 'name': 'math'}])
+    await session.execute(insert(Lecture), [{'lecture_id': lecture, 'subject_id': subject, 'teacher_info_id': teacher}])
+    await session.execute(insert(Class), [{'class_id': c, 'lecture_id': lecture, 'division': i} for i, c in enumerate(classes)])
+    await session.execute(insert(Enrollment), [
+        {'class_id': classes[0], 'user_info_id': students['a']},
+        {'class_id': classes[1], 'user_info_id': students['a']},
+        {'class_id': classes[0], 'user_info_id': students['c']},
+    ])
+    return students, classes
+
+async def enrollments(session, table=Enrollment.__table__) -> set[tuple]:
+    return set((await session.execute(select(table.c.class_id, table.c.user_info_id))).tuples())
+
+
+def test_apply_diff_inside_scope(run):
+    async def work(session):
+        students, classes = await seed(session)
+        targets = [(classes[0], students['a']), (classes[2], students['b']), (classes[2], students['b'])]
+        context = ImportContext(session, generations=frozenset({1}))
+        result = await apply_diff(session, Enrollment, KEYS, targets, scope=context.student_scope(),
+                                  on_changed=context.enrollments_changed)
+        return students, classes, result, context, await enrollments(session)
+
+    students, classes, result, context, rows = run(work)
+    assert (result.added, result.removed, result.kept) == (1, 1, 1)
+    assert context.changed_classes == {classes[2], classes[1]}
+    assert context.changed_students == {students['b'], students['a']}
+    # 2기 학생은 목록에 없어도 범위 밖이라 남는다
+    assert rows == {(classes[0], students['a']), (classes[2], students['b']), (classes[0], students['c'])}
+
+def test_apply_diff_without_scope_removes_everything_else(run):
+    async def work(session):
+        students, classes = await seed(session)
+        result = await apply_diff(session, Enrollment, KEYS, [(classes[0], students['a'])])
+        return students, classes, result, await enrollments(session)
+
+    students, classes, result, rows = run(work)
+    assert (result.added, result.removed, result.kept) == (0, 2, 1)
+    assert rows == {(classes[0], students['a'])}
+
+def test_apply_diff_keeps_stale_rows_without_remove(run):
+    async def work(session):
+        students, classes = await seed(session)
+        scope = ImportContext(session, generations=frozenset({1})).student_scope()
+        result = await apply_diff(session, Enrollment, KEYS, [(classes[2], students['b'])], scope=scope, remove=False)
+        return students, classes, result, await enrollments(session)
+
+    students, classes, result, rows = run(work)
+    assert (result.added, result.removed, result.kept) == (1, 0, 2)
+    assert len(rows) == 4
+
+def test_apply_diff_into_other_table(run):
+    # into가 있으면 원래 테이블은 그대로, 범위 안의 결과 전체를 다른 테이블에 쓴다
+    metadata = MetaData()
+    for model in (Class, UserInfo):
+        model.__table__.to_metadata(metadata)
+    table = Enrollment.__table__.to_metadata(metadata, name='enrollments_into')
+
+    async def work(session):
+        students, classes = await seed(session)
+        await (await session.connection()).run_sync(metadata.create_all, tables=[table])
+
+        before = await enrollments(session)
+        scope = ImportContext(session, generations=frozenset({1})).student_scope()
+        targets = [(classes[0], students['a']), (classes[2], students['b'])]
+        result = {}
+        for remove in (True, False):
+            await session.execute(table.delete())
+            await apply_diff(session, Enrollment, KEYS, targets, scope=scope, into=table, remove=remove)
+            result[remove] = await enrollments(session, table)
+
+        return students, classes, before, await enrollments(session), result
+
+    students, classes, before, after, result = run(work)
+    assert before == after
+    assert result[True] == {(classes[0], students['a']), (classes[2], students['b'])}
+    assert result[False] == result[True] | {(classes[1], students['a'])}
+
+def test_insert_missing_skips_existing_keys(run):
+    async def work(session):
+        students, classes = await seed(session)
+        keys = [(classes[0], students['a']), (classes[2], students['a']), (classes[2], students['a'])]
+        chunks = []
+        result = await insert_missing(session, Enrollment, KEYS, keys, on_changed=chunks.append)
+        return classes, students, result, chunks, await enrollments(session)
+
+    classes, students, result, chunks, rows = run(work)
+    assert (result.added, result.removed, result.kept) == (1, 0, 1)
+    assert chunks == [[(classes[2], students['a'])]]
+    assert len(rows) == 4
+
+def test_bulk_insert_copy_merges_into_table(run):
+    # PostgreSQL에서는 COPY로 임시 테이블에 넣고 ON CONFLICT DO NOTHING으로 합친다, 다른 곳에서는 batched insert로 돌아간다
+    async def work(session):
+        students, classes = await seed(session)
+        rows = [{'class_id': c, 'user_info_id': students['b']} for c in classes]
+        rows.append({'class_id': classes[0], 'user_info_id': students['a']}) # 이미 있다
+        total = await bulk_insert(session, Enrollment, iter(rows), ignore=True, copy=True)
+        return session.get_bind().dialect.name, copy_supported(session), students, classes, total, await enrollments(session)
+
+    dialect, copied, students, classes, total, rows = run(work)
+    assert copied == (dialect == 'postgresql')
+    assert total == 4
+    assert rows == {(c, students['b']) for c in classes} | {(classes[0], students['a']), (classes[1], students['a']),
+                                                          (classes[0], students['c'])}
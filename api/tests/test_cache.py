@@ -0,0 +1,18 @@
+from datetime import datetime
+
+from app.upload import cache
+from app.upload.cache import cache_key
+
+class NewYear(datetime):
+
+    @classmethod
+    def now(cls, tz=None):
+        return datetime(datetime.now().year + 1, 1, 1, tzinfo=tz)
+
+def test_cache_key_changes_with_the_year(monkeypatch):
+    # 캐시한 기수는 파싱한 해의 학년 기준이다, 해가 바뀌면 다시 파싱해야 한다
+    key = cache_key('ab' * 32)
+    assert cache_key('ab' * 32) == key
+
+    monkeypatch.setattr(cache, 'datetime', NewYear)
+    assert cache_key('ab' * 32) != key
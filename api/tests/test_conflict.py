@@ -0,0 +1,66 @@
+import random
+
+import pytest
+
+from app.upload.conflict import find_conflicts
+from app.upload.schema import EnrollmentInfo, PeriodInfo
+
+def student(n: int, *subjects: tuple[str, int]) -> EnrollmentInfo:
+    return EnrollmentInfo(1, 1, n, f'학생{n}', 20, subjects)
+
+def lesson(subject: str, division: int, day: int, period: int) -> PeriodInfo:
+    return PeriodInfo(subject, '교사', division, day, period)
+
+def brute_force(enrollments, periods) -> list[tuple]:
+    slots = {}
+    for p in periods:
+        slots.setdefault((p.subject, p.division), set()).add((p.day, p.period))
+
+    conflicts = []
+    for e in enrollments:
+        taken = {}
+        for key in e.subjects:
+            for slot in slots.get(key, ()):
+                taken.setdefault(slot, []).append(key)
+
+        clashing = {slot: keys for slot, keys in taken.items() if len(keys) > 1}
+        if clashing:
+            conflicts.append((e.number, tuple(sorted(clashing)),
+                              {key for keys in clashing.values() for key in keys}))
+
+    return conflicts
+
+def normalize(conflicts) -> list[tuple]:
+    return [(c.number, c.slots, set(c.subjects)) for c in conflicts]
+
+
+PERIODS = [
+    lesson('수학', 1, 0, 1), lesson('수학', 1, 2, 3),
+    lesson('국어', 1, 0, 1), lesson('국어', 1, 1, 1),
+    lesson('영어', 1, 0, 2), lesson('영어', 1, 2, 3),
+    lesson('과학', 1, 4, 7),
+]
+
+@pytest.mark.parametrize('enrollment, expected', [
+    (student(1, ('수학', 1), ('국어', 1)), [(1, ((0, 1),), {('수학', 1), ('국어', 1)})]),
+    (student(2, ('수학', 1), ('국어', 1), ('영어', 1)),
+     [(2, ((0, 1), (2, 3)), {('수학', 1), ('국어', 1), ('영어', 1)})]),
+    (student(3, ('국어', 1), ('영어', 1), ('과학', 1)), []),
+    (student(4, ('수학', 1)), []),
+    (student(5, ('수학', 1), ('없는과목', 1)), []),
+])
+def test_small_cases(enrollment, expected):
+    assert brute_force([enrollment], PERIODS) == expected
+    assert normalize(find_conflicts([enrollment], PERIODS)) == expected
+
+@pytest.mark.parametrize('periods_per_day', [8, 15]) # 40칸은 word 하나, 75칸은 word 둘
+def test_matches_brute_force(periods_per_day):
+    rnd = random.Random(periods_per_day)
+    subjects = [(f'과목{s}', d) for s in range(30) for d in (1, 2)]
+    periods = [lesson(s, d, rnd.randrange(5), rnd.randrange(1, periods_per_day + 1))
+               for s, d in subjects for _ in range(3)]
+    enrollments = [student(n, *rnd.sample(subjects, rnd.randint(1, 8))) for n in range(300)]
+
+    expected = brute_force(enrollments, periods)
+    assert expected and len(expected) < len(enrollments)
+    assert normalize(find_conflicts(enrollments, periods)) == expected
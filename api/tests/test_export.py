@@ -0,0 +1,70 @@
+import asyncio
+import threading
+import time
+
+from openpyxl import Workbook, load_workbook
+from openpyxl.worksheet._write_only import WriteOnlyWorksheet
+from sqlalchemy import insert
+
+from app.auth.crud import Role
+from app.auth.model import UserInfo
+from app.core.database import generate_ulid
+from app.timetable.model import Subject, Lecture
+from app.upload.export import write_lectures
+
+LECTURES = 5000
+SLOW_SAVE = 0.3
+
+def test_export_keeps_the_loop_responsive(sessionmaker, monkeypatch, tmp_path):
+    # openpyxl이 루프에서 돌면 느린 save 동안 tick이 멈춘다
+    threads = set()
+    append, save = WriteOnlyWorksheet.append, Workbook.save
+
+    def recording_append(self, row):
+        threads.add(threading.get_ident())
+        append(self, row)
+
+    def slow_save(self, filename):
+        time.sleep(SLOW_SAVE)
+        save(self, filename)
+
+    monkeypatch.setattr(WriteOnlyWorksheet, 'append', recording_append)
+    monkeypatch.setattr(Workbook, 'save', slow_save)
+
+    teacher, subject = generate_ulid(), generate_ulid()
+    path = tmp_path / 'lecture.xlsx'
+
+    async def main():
+        async with sessionmaker() as session:
+            await session.execute(insert(UserInfo), [{'user_info_id': teacher, 'name': 't', 'role': Role.TEACHER}])
+            await session.execute(insert(Subject), [{'subject_id': subject, 'name': 'math'}])
+            await session.execute(insert(Lecture), [
+                {'lecture_id': generate_ulid(), 'subject_id': subject, 'teacher_info_id': teacher, 'room': str(i)}
+                for i in range(LECTURES)
+            ])
+            await session.commit()
+
+            gaps, done = [], asyncio.Event()
+            async def tick():
+                last = time.perf_counter()
+                while not done.is_set():
+                    await asyncio.sleep(0.005)
+                    now = time.perf_counter()
+                    gaps.append(now - last)
+                    last = now
+
+            ticker = asyncio.create_task(tick())
+            try:
+                lectures = await write_lectures(session, path)
+            finally:
+                done.set()
+                await ticker
+
+            return lectures, max(gaps), threading.get_ident()
+
+    lectures, gap, loop_thread = asyncio.run(main())
+    assert lectures == LECTURES
+    assert loop_thread not in threads
+    assert gap < SLOW_SAVE / 2
+    rows = list(load_workbook(path, read_only=True).active.iter_rows(min_row=2, values_only=True))
+    assert sum(len([c for c in row[1:] if c is not None]) // 2 for row in rows) == LECTURES
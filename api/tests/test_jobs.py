@@ -0,0 +1,119 @@
+import asyncio
+import threading
+
+import pytest
+
+from sqlalchemy import select, func
+
+from app.core.config import configs
+from app.timetable.model import Enrollment
+from app.upload import jobs
+from app.upload.jobs import JobStage, SavedUpload, UploadJob, submit_upload_job, import_workbooks
+from app.upload.synthetic import SyntheticSpec, generate
+
+def test_jobs_run_one_at_a_time(monkeypatch, tmp_path):
+    running = []
+    overlaps = []
+
+    async def import_workbooks(job, *args, **kwargs):
+        job.begin(JobStage.PARSE)
+        overlaps.append(len(running))
+        running.append(job)
+        await asyncio.sleep(0.01)
+        running.remove(job)
+        return set()
+
+    monkeypatch.setattr(jobs, 'import_workbooks', import_workbooks)
+    uploads = tuple(SavedUpload(str(tmp_path / name), 0, bytes(32)) for name in ('e', 'l', 'p'))
+
+    async def main():
+        submitted = [submit_upload_job(tmp_path, uploads) for _ in range(3)]
+        await asyncio.sleep(0.005)
+        stages = [job.stage for job in submitted]
+        await asyncio.gather(*jobs.tasks)
+        return submitted, stages
+
+    submitted, stages = asyncio.run(main())
+    assert stages == [JobStage.PARSE, JobStage.QUEUED, JobStage.QUEUED]
+    assert overlaps == [0, 0, 0]
+    assert [job.stage for job in submitted] == [JobStage.DONE] * 3
+
+def test_diff_after_plain_import_is_not_skipped(sessionmaker, monkeypatch, tmp_path):
+    # 지우지 않는 업로드 뒤에는 같은 파일의 diff 업로드도 남은 행을 지워야 한다
+    monkeypatch.setattr(configs, 'UPLOAD_CACHE_BYTES', 0)
+    first = generate(tmp_path / 'a', SyntheticSpec(students=60, subjects=6, seed=0))
+    second = generate(tmp_path / 'b', SyntheticSpec(students=60, subjects=6, seed=1))
+
+    async def upload(paths, diff) -> tuple[bool, int]:
+        job = UploadJob()
+        async with sessionmaker() as session:
+            await import_workbooks(job, *paths, session, diff=diff)
+            return job.skipped, (await session.execute(select(func.count()).select_from(Enrollment))).scalar()
+
+    async def main():
+        counts = {}
+        for name, paths, diff in (('a', first, False), ('b', second, False), ('b diff', second, True),
+                                  ('b diff again', second, True)):
+            counts[name] = await upload(paths, diff)
+        return counts
+
+    counts = asyncio.run(main())
+    stale = counts['b'][1]
+    skipped, rows = counts['b diff']
+    assert not skipped and rows < stale
+    assert counts['b diff again'] == (True, rows) # 마지막이 같은 파일의 diff 업로드라 건너뛴다
+
+@pytest.mark.parametrize('option', ['swap', 'touch_all'])
+def test_diff_with_rebuild_options_is_not_skipped(sessionmaker, monkeypatch, tmp_path, option):
+    # 같은 파일의 diff 업로드 뒤라도 swap이나 touch_all을 달면 다시 올린다
+    monkeypatch.setattr(configs, 'UPLOAD_CACHE_BYTES', 0)
+    paths = generate(tmp_path, SyntheticSpec(students=30, subjects=4, seed=0))
+
+    async def upload(**options) -> bool:
+        job = UploadJob()
+        async with sessionmaker() as session:
+            await import_workbooks(job, *paths, session, diff=True, **options)
+        return job.skipped
+
+    async def main():
+        return [await upload(), await upload(**{option: True}), await upload()]
+
+    assert asyncio.run(main()) == [False, False, True]
+
+class Stop(Exception):
+    pass
+
+def test_import_reads_files_off_the_loop(monkeypatch):
+    # 해시와 캐시의 pickle은 루프가 아닌 thread에서 한다
+    threads = {}
+
+    def hash_files(*paths):
+        threads['hash'] = threading.get_ident()
+        return 'ab' * 32
+
+    def load_parsed(key):
+        threads['load'] = threading.get_ident()
+        return None
+
+    async def parse_workbooks(*paths):
+        return [], [], [], []
+
+    def store_parsed(key, parsed):
+        threads['store'] = threading.get_ident()
+        raise Stop()
+
+    monkeypatch.setattr(jobs, 'hash_files', hash_files)
+    monkeypatch.setattr(jobs, 'load_parsed', load_parsed)
+    monkeypatch.setattr(jobs, 'parse_workbooks', parse_workbooks)
+    monkeypatch.setattr(jobs, 'store_parsed', store_parsed)
+
+    async def main():
+        try:
+            await import_workbooks(UploadJob(), 'e', 'l', 'p', None)
+        except Stop:
+            pass
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(main())
+    assert set(threads) == {'hash', 'load', 'store'}
+    assert loop_thread not in threads.values()
@@ -0,0 +1,63 @@
+import asyncio
+
+import httpx
+from fastapi import FastAPI, UploadFile, File
+
+from app.core.middleware import BodyLimitMiddleware
+
+LIMIT = 64 * 1024
+CHUNK = 16 * 1024
+
+def make_app():
+    app = FastAPI()
+    app.add_middleware(BodyLimitMiddleware, limits={'/upload': LIMIT})
+
+    @app.post('/upload')
+    async def upload(file: UploadFile = File()):
+        return {'size': len(await file.read())}
+
+    @app.post('/other')
+    async def other(file: UploadFile = File()):
+        return {'size': len(await file.read())}
+
+    return app
+
+def multipart(size: int, sent: list[int]):
+    async def body():
+        yield b'--a\r\nContent-Disposition: form-data; name="file"; filename="f"\r\n\r\n'
+        for _ in range(0, size, CHUNK):
+            sent.append(CHUNK)
+            yield b'x' * CHUNK
+        yield b'\r\n--a--\r\n'
+    return body()
+
+def post(path: str, size: int, **kwargs) -> tuple[httpx.Response, int]:
+    sent = []
+    headers = {'content-type': 'multipart/form-data; boundary=a', **kwargs.pop('headers', {})}
+
+    async def run():
+        transport = httpx.ASGITransport(app=make_app())
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return await client.post(path, content=multipart(size, sent), headers=headers)
+
+    return asyncio.run(run()), sum(sent)
+
+def test_small_body_passes():
+    response, _ = post('/upload', LIMIT // 2)
+    assert response.status_code == 200
+    assert response.json() == {'size': LIMIT // 2}
+
+def test_content_length_rejected_before_reading():
+    response, sent = post('/upload', LIMIT * 4, headers={'content-length': str(LIMIT * 4)})
+    assert response.status_code == 413
+    assert response.json()['code'] == 'BODY_TOO_LARGE'
+    assert sent == 0
+
+def test_stream_stops_at_limit():
+    response, sent = post('/upload', LIMIT * 16)
+    assert response.status_code == 413
+    assert sent <= LIMIT + CHUNK
+
+def test_other_paths_unlimited():
+    response, _ = post('/other', LIMIT * 2)
+    assert response.status_code == 200
@@ -0,0 +1,31 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select, inspect
+
+from app.timetable.model import Enrollment, Period
+from app.upload.staging import Staging
+
+def test_swap_does_not_deadlock_with_readers(sessionmaker):
+    # 읽는 쪽이 enrollments를 잡은 채로 periods를 읽어도, swap은 물러났다가 읽기가 끝난 뒤에 바꾼다
+    if sessionmaker.kw['bind'].dialect.name != 'postgresql':
+        pytest.skip('table locks are only taken on PostgreSQL')
+
+    async def main():
+        async with sessionmaker() as session, sessionmaker() as reader:
+            staging = await Staging.create(session)
+            await reader.execute(select(Enrollment.class_id).limit(1))
+            swap = asyncio.create_task(staging.swap(session))
+            await asyncio.sleep(0.2)
+            await reader.execute(select(Period.class_id).limit(1))
+            await reader.rollback()
+
+            await swap
+            await session.commit()
+            await staging.drop(session)
+            connection = await session.connection()
+            return await connection.run_sync(lambda c: inspect(c).get_table_names())
+
+    tables = asyncio.run(main())
+    assert {'enrollments', 'periods'} <= set(tables)
+    assert not [t for t in tables if '_staging_' in t or '_old_' in t]
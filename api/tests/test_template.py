@@ -0,0 +1,143 @@
+import random
+
+import numpy as np
+import pytest
+from openpyxl import Workbook
+
+from app.upload.synthetic import SyntheticSpec, generate
+from app.upload.template import template, template_room, template_period, iter_board, parse_lectures
+
+TEMPLATES = {
+    'enrollment': template,
+    'lecture': template_room,
+    'period': template_period,
+}
+
+# 벡터화 전 Template.convolute, match_at과 stamp를 그대로 옮겨 둔 것
+def baseline_convolute(t, board: np.ndarray) -> dict[tuple[int], list[list]]:
+    def match_at(x, y) -> bool:
+        h, w = board.shape
+        for j in range(t.height):
+            for i in range(t.width):
+                cell = t.template[j][i]
+                if x + i >= w or y + j >= h:
+                    content = ""
+                else:
+                    content = str(board[y+j][x+i])
+
+                if not cell.match(content):
+                    return False
+        return True
+
+    def stamp(x, y) -> list[list]:
+        if not match_at(x, y):
+            return []
+
+        h, w = board.shape
+        contents = []
+        for j in range(t.height):
+            contents_row = []
+            for i in range(t.width):
+                if x + i >= w or y + j >= h:
+                    continue
+
+                cell = t.template[j][i]
+                content = cell.interpret(str(board[y+j][x+i]))
+                contents_row.append((cell.name(), content))
+
+            contents.append(contents_row)
+        return contents
+
+    h, w = board.shape
+    if h < t.height or w < t.width:
+        return {}
+
+    result = {}
+    for j in range(h - t.height + 1):
+        for i in range(w - t.width + 1):
+            contents = stamp(i, j)
+            if not contents:
+                continue
+
+            result[(i, j)] = contents
+
+    return result
+
+def whole_board(path, height: int):
+    (_, board), = iter_board(path, height, chunk=10 ** 9)
+    return board
+
+def assert_equivalent(t, path):
+    board = whole_board(path, t.height)
+    loop = list(t.convolute(board, vectorized=False).items())
+    assert loop
+    assert list(baseline_convolute(t, board).items()) == loop
+    assert list(t.convolute(board).items()) == loop
+
+    # 창 경계에 걸친 블록도 한 번씩만 나와야 한다
+    for chunk in (1, 7, 64):
+        assert list(t.iter_convolute(iter_board(path, t.height, chunk=chunk))) == loop
+
+
+@pytest.fixture(scope='module')
+def workbooks(tmp_path_factory):
+    paths = generate(tmp_path_factory.mktemp('synthetic'), SyntheticSpec(students=90, subjects=12, multi_teacher=3))
+    return dict(zip(TEMPLATES, paths))
+
+@pytest.mark.parametrize('kind', TEMPLATES)
+def test_vectorized_matches_loop(workbooks, kind):
+    assert_equivalent(TEMPLATES[kind], workbooks[kind])
+
+
+# 템플릿 칸마다 맞는 값, 안 맞는 값, 빈 값과 숫자를 섞는다
+VOCABULARY = [None, None, None, '', ' ', 101, 3.5, '10101 홍길동', '30215', '25 학점', '3학점',
+              '수학 1반 301', '국어 2반', '수학', '김선생', '1,2(1분반)', '3(2)', '1,(1분반)']
+
+def random_board(t, rnd: random.Random) -> np.ndarray:
+    # 맞는 블록을 몇 개 심고 몇 칸을 아무 값으로 바꿔서 맞는 곳과 안 맞는 곳이 둘 다 나오게 한다
+    h, w = rnd.randint(t.height, 3 * t.height), rnd.randint(t.width, 2 * t.width)
+    board = np.full((h, w), None, dtype=object)
+    for _ in range(rnd.randint(1, 3)): # 대부분은 판 안에, 가끔 가장자리에 걸치게
+        y, x = rnd.randrange(h - t.height // 2), rnd.randrange(w - t.width // 2)
+        for j, row in enumerate(t.template[:h - y]):
+            for i, cell in enumerate(row[:w - x]):
+                board[y + j, x + i] = rnd.choice([v for v in VOCABULARY if cell.match(str(v))])
+
+    for _ in range(rnd.randint(0, 4)):
+        board[rnd.randrange(h), rnd.randrange(w)] = rnd.choice(VOCABULARY)
+    return board
+
+@pytest.mark.parametrize('kind', TEMPLATES)
+@pytest.mark.parametrize('seed', range(30))
+def test_vectorized_matches_baseline_on_random_boards(kind, seed):
+    t = TEMPLATES[kind]
+    board = random_board(t, random.Random(seed))
+    assert list(t.convolute(board).items()) == list(baseline_convolute(t, board).items())
+
+
+@pytest.fixture
+def numeric_lectures(tmp_path):
+    # 숫자 교실과 빈 칸이 섞인 열, pandas는 이런 열을 float으로 읽었다
+    workbook = Workbook()
+    worksheet = workbook.active
+    worksheet.append(['과목', '교사', '교실', '교사', '교실', '교사', '교실'])
+    worksheet.append(['수학', '김선생', 101, '이선생', 102, None, None])
+    worksheet.append(['국어', '박선생', 201, None, None, None, None])
+    worksheet.append(['과학', '최선생', 301.5, '정선생', '실험실', '한선생', 303])
+    worksheet.append([None] * 7)
+    worksheet.append(['영어', '윤선생', 401, None, None, None, None])
+
+    path = tmp_path / 'lecture.xlsx'
+    workbook.save(path)
+    return str(path)
+
+def test_sparse_numeric_cells(numeric_lectures):
+    assert_equivalent(template_room, numeric_lectures)
+
+    rooms = {(l.subject, l.teacher): l.room for l in parse_lectures(numeric_lectures)}
+    assert rooms == {
+        ('수학', '김선생'): '101', ('수학', '이선생'): '102',
+        ('국어', '박선생'): '201',
+        ('과학', '최선생'): '301.5', ('과학', '정선생'): '실험실', ('과학', '한선생'): '303',
+        ('영어', '윤선생'): '401',
+    }
@@ -0,0 +1,20 @@
+from types import SimpleNamespace
+
+from app.timetable.schemas import TimetableSchema
+
+def lecture_class(room, teacher='김선생'):
+    lecture = SimpleNamespace(subject=SimpleNamespace(name='수학'), room=room,
+                              teacher_info=SimpleNamespace(name=teacher) if teacher else None)
+    return SimpleNamespace(class_id='01M58BR8C71TTYDX132WAJV9JT', division=1, lecture=lecture,
+                           periods=[SimpleNamespace(period=1, day=1)], classmates=[])
+
+def test_lecture_without_room_or_teacher():
+    for room, teacher in (('101', '김선생'), (None, '김선생'), ('101', None)):
+        timetable = TimetableSchema(username='u', name='학생', timetable=[lecture_class(room, teacher)])
+
+        # 캐시는 model_dump()한 dict를 들고 있다가 응답 모델로 다시 검증한다
+        cached = TimetableSchema.model_validate(timetable.model_dump())
+        assert cached == timetable
+        assert cached.timetable[0].room == room
+        assert cached.timetable[0].teacher == teacher
+        assert cached.timetable[0].periods[0].day == 'Mon'
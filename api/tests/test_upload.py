@@ -0,0 +1,54 @@
+import pytest
+from sqlalchemy import select, insert
+
+from app.auth.crud import Role
+from app.auth.model import UserInfo
+from app.core.database import generate_ulid
+from app.timetable.model import Subject, Lecture, Class, Period
+from app.upload.context import ImportContext
+from app.upload.schema import PeriodInfo
+from app.upload.staging import Staging
+from app.upload.upload import upload_periods
+
+@pytest.mark.parametrize('swap', [False, True])
+def test_scoped_periods_leave_other_classes(run, swap):
+    # 1학년만 올린다, 2학년만 듣는 art의 시간은 워크북에 새 시간이 있어도 그대로다
+    teacher = generate_ulid()
+    subjects = {name: generate_ulid() for name in ('math', 'art')}
+    classes = {name: generate_ulid() for name in subjects}
+
+    async def work(session):
+        await session.execute(insert(UserInfo), [{'user_info_id': teacher, 'name': 't', 'role': Role.TEACHER}])
+        await session.execute(insert(Subject), [{'subject_id': s, 'name': n} for n, s in subjects.items()])
+        lectures = {name: generate_ulid() for name in subjects}
+        await session.execute(insert(Lecture), [
+            {'lecture_id': lectures[n], 'subject_id': s, 'teacher_info_id': teacher} for n, s in subjects.items()
+        ])
+        await session.execute(insert(Class), [
+            {'class_id': classes[n], 'lecture_id': lectures[n], 'division': 1} for n in subjects
+        ])
+        await session.execute(insert(Period), [
+            {'class_id': classes['math'], 'day': 1, 'period': 1},
+            {'class_id': classes['art'], 'day': 2, 'period': 2},
+        ])
+        await session.commit()
+
+        context = ImportContext(session, generations=frozenset({1}))
+        await context.load()
+        staging = await Staging.create(session) if swap else None
+        periods = [PeriodInfo('math', 't', 1, 1, 3), PeriodInfo('art', 't', 1, 2, 4)]
+        result = await upload_periods(periods, context, diff=True, staging=staging, subjects={('math', 1)})
+        if staging is not None:
+            await staging.swap(session)
+        await session.commit()
+        if staging is not None:
+            await staging.drop(session)
+
+        rows = set((await session.execute(select(Period.class_id, Period.day, Period.period))).tuples())
+        return result, rows, context.changed_classes
+
+    result, rows, changed = run(work)
+    assert (result.added, result.removed) == (1, 1)
+    assert rows == {(classes['math'], 1, 3), (classes['art'], 2, 2)}
+    assert changed == {classes['math']}
+
@@ -0,0 +1,71 @@
+import pytest
+from sqlalchemy import select, insert
+
+from app.auth.crud import Role
+from app.auth.model import UserInfo
+from app.core.database import upsert, generate_ulid
+from app.timetable.model import Subject, Lecture, Class, Enrollment
+from app.upload.bulk import bulk_insert
+
+async def subjects(session) -> dict:
+    return {s: n for s, n in await session.execute(select(Subject.subject_id, Subject.name))}
+
+
+def test_upsert_ignores_existing_keys(run):
+    subject_id = generate_ulid()
+
+    async def work(session):
+        dialect = session.get_bind().dialect.name
+        await session.execute(upsert(dialect, Subject), [{'subject_id': subject_id, 'name': 'math'}])
+        await session.execute(upsert(dialect, Subject), [{'subject_id': subject_id, 'name': 'science'}])
+        return await subjects(session)
+
+    assert run(work) == {subject_id: 'math'}
+
+def test_upsert_updates_columns(run):
+    subject_id = generate_ulid()
+
+    async def work(session):
+        dialect = session.get_bind().dialect.name
+        await session.execute(upsert(dialect, Subject), [{'subject_id': subject_id, 'name': 'math'}])
+        stmt = upsert(dialect, Subject.__table__, update=('name',)) # 모델 없는 Table도 받는다
+        await session.execute(stmt, [{'subject_id': subject_id, 'name': 'science'}])
+        return await subjects(session)
+
+    assert run(work) == {subject_id: 'science'}
+
+def test_upsert_conflict_columns(run):
+    # primary key가 아닌 unique key로 충돌을 판단한다
+    first, second = generate_ulid(), generate_ulid()
+
+    async def work(session):
+        dialect = session.get_bind().dialect.name
+        await session.execute(upsert(dialect, Subject), [{'subject_id': first, 'name': 'math'}])
+        stmt = upsert(dialect, Subject, update=('subject_id',), conflict=('name',))
+        await session.execute(stmt, [{'subject_id': second, 'name': 'math'}])
+        return await subjects(session)
+
+    assert run(work) == {second: 'math'}
+
+def test_bulk_insert_ignore_skips_duplicates(run):
+    teacher, subject, lecture = generate_ulid(), generate_ulid(), generate_ulid()
+    keys = [(generate_ulid(), generate_ulid()) for _ in range(3)]
+
+    async def work(session):
+        # PostgreSQL은 foreign key를 확인하므로 학생과 수업도 실제로 만든다
+        await session.execute(insert(UserInfo), [{'user_info_id': teacher, 'name': 't', 'role': Role.TEACHER}]
+                              + [{'user_info_id': u, 'name': 's', 'role': Role.STUDENT, 'generation': 1} for _, u in keys])
+        await session.execute(insert(Subject), [{'subject_id': subject, 'name': 'math'}])
+        await session.execute(insert(Lecture), [{'lecture_id': lecture, 'subject_id': subject, 'teacher_info_id': teacher}])
+        await session.execute(insert(Class), [{'class_id': c, 'lecture_id': lecture, 'division': i} for i, (c, _) in enumerate(keys)])
+
+        rows = [{'class_id': c, 'user_info_id': u} for c, u in keys]
+        await bulk_insert(session, Enrollment, rows[:2])
+        await bulk_insert(session, Enrollment, rows, ignore=True)
+        return set((await session.execute(select(Enrollment.class_id, Enrollment.user_info_id))).tuples())
+
+    assert run(work) == set(keys)
+
+def test_upsert_unknown_dialect():
+    with pytest.raises(NotImplementedError):
+        upsert('oracle', Subject)